@@ -8,101 +8,585 @@ import traceback
 import socket
 import shlex
 import subprocess
+import signal
+import logging
+import selectors
+import queue
+import itertools
+import heapq
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+import importlib.util
+import contextlib
+import shutil
+from collections import OrderedDict, deque
+from dataclasses import MISSING, dataclass, field, fields
 from pathlib import Path
-from flask import Flask, request, jsonify, send_file, render_template, send_from_directory
+from flask import Flask, request, jsonify, render_template, send_from_directory
+from flask.json.provider import DefaultJSONProvider
 import yt_dlp
 import html
 import http.cookiejar as cookiejar
 import json
+import sqlite3
+import re
 import base64
+import atexit
+import functools
+import io
+import urllib.parse
+import urllib.request
+import mimetypes
+import unicodedata
 
-# Optional browser cookie support
+# Optional browser cookie support (imported on first use; it is slow to import)
+BROWSER_COOKIE3_AVAILABLE = importlib.util.find_spec("browser_cookie3") is not None
+
+# Optional production server for `python app.py` (POSIX only; imported when used)
+GUNICORN_AVAILABLE = os.name == "posix" and importlib.util.find_spec("gunicorn") is not None
+
+# Optional fast JSON encoding/decoding for responses and cookie files
 try:
-    import browser_cookie3
-    BROWSER_COOKIE3_AVAILABLE = True
+    import orjson
+    ORJSON_AVAILABLE = True
+except Exception:
+    ORJSON_AVAILABLE = False
+
+json_loads = orjson.loads if ORJSON_AVAILABLE else json.loads
+
+# Optional in-process media probing (libavformat via PyAV); falls back to ffprobe
+try:
+    import av
+    AV_AVAILABLE = True
 except Exception:
-    BROWSER_COOKIE3_AVAILABLE = False
+    AV_AVAILABLE = False
 
 # App setup
+class OrjsonProvider(DefaultJSONProvider):
+    """jsonify() through orjson; anything orjson rejects goes to Flask's encoder."""
+
+    def dumps(self, obj, **kwargs):
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode("utf-8")
+        except TypeError:
+            return super().dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        try:
+            body = orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            return super().response(*args, **kwargs)  # e.g. ints beyond 64 bits in extractor metadata
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
 app = Flask(__name__, static_folder="static", template_folder="templates")
 app.config['JSON_SORT_KEYS'] = False
+if ORJSON_AVAILABLE:
+    app.json = OrjsonProvider(app)
+app.json.sort_keys = False  # JSON_SORT_KEYS is ignored since Flask 2.3
 DOWNLOAD_DIR = Path("downloads")
+OUT_TEMPLATE = str(DOWNLOAD_DIR / "%(title)s - %(id)s.%(ext)s")
 DOWNLOAD_DIR.mkdir(exist_ok=True)
 
 # In-memory tasks store
-TASKS = {}
+TASK_MESSAGES_MAX = 200  # per-task live log length; oldest lines drop off first
+
+
+@dataclass(slots=True)
+class Task:
+    status: str
+    url: str
+    created: float
+    queue_seq: int = 0  # position in DOWNLOAD_POOL's FIFO, for queued_ahead
+    # raw counters from the progress hook; the "NN%" string is only built in to_dict()
+    progress_pct: int = 0
+    downloaded_bytes: int = 0
+    total_bytes: int | None = None
+    last_progress_time: float = 0.0
+    filename: str | None = None
+    chosen_format: str | None = None
+    info: dict | None = None
+    speed: float | None = None
+    last_error: str | None = None
+    error: str | None = None
+    messages: deque = field(default_factory=lambda: deque(maxlen=TASK_MESSAGES_MAX))
+
+    def reset(self, status, url, created):
+        """Reinitialise a recycled record in place; the messages deque is cleared, not reallocated."""
+        for f in fields(self):
+            if f.default is not MISSING:
+                setattr(self, f.name, f.default)
+        self.messages.clear()
+        self.status = status
+        self.url = url
+        self.created = created
+
+    def to_dict(self):
+        d = {name: getattr(self, name) for name in _TASK_FIELD_NAMES}
+        d["messages"] = list(self.messages)
+        d["progress"] = f"{self.progress_pct}%"
+        if self.status == "queued":
+            d["queued_ahead"] = max(self.queue_seq - 1 - DOWNLOAD_QUEUE["started"], 0)
+        return d
+
+
+# to_dict() runs on every /task poll; resolve the dataclass fields once
+_TASK_FIELD_NAMES = tuple(f.name for f in fields(Task))
+
+# Insertion-ordered so the oldest entries are evicted first once MAX_TASKS is reached.
+# TASK_LOCK guards inserts/removals only; progress hooks write task fields without it
+# (single attribute stores are atomic under the GIL).
+TASKS: "OrderedDict[str, Task]" = OrderedDict()
 TASK_LOCK = threading.Lock()
+MAX_TASKS = int(os.environ.get("MAX_TASKS", "1024"))
+
+# filename / unescaped filename / id / title slug / filename slug -> finished file,
+# filled as tasks complete so serve_file's fallbacks are one dict hit. Kept as an LRU of
+# FILE_INDEX_MAX keys; keys whose file is gone are dropped when a lookup hits them.
+FILE_INDEX: "OrderedDict[str, Path]" = OrderedDict()
+FILE_INDEX_LOCK = threading.Lock()
+FILE_INDEX_MAX = 5 * MAX_TASKS
+
+# Downloads run on a bounded pool; extra requests wait in "queued" state
+DL_WORKERS = int(os.environ.get("DL_WORKERS", "4"))
+DOWNLOAD_POOL = ThreadPoolExecutor(max_workers=DL_WORKERS, thread_name_prefix="download")
+# Running + waiting downloads; beyond this /download answers 503 instead of growing the queue
+DOWNLOAD_SLOTS = threading.BoundedSemaphore(DL_WORKERS + int(os.environ.get("MAX_QUEUED_DOWNLOADS", "32")))
+# The pool starts jobs in submit order, so a queued task's wait is its sequence
+# number minus the highest one started so far
+DOWNLOAD_QUEUE = {"seq": itertools.count(1), "started": 0}
+DOWNLOAD_QUEUE_LOCK = threading.Lock()
+STALL_MONITOR = {"thread": None}
 
 # ---------------- Utilities ----------------
 def safe_basename(path: str) -> str:
     return Path(path).name
 
 
+def _unlink_quiet(path):
+    forget_probe(path)
+    try:
+        os.unlink(path)
+    except Exception:
+        pass
+
+
+# letters, digits (any script), "_" and "-" are kept; everything else is dropped
+_SLUG_RE = re.compile(r"[^\w-]+")
+
+
+# same result for ASCII text, but str.translate runs in C without the regex engine
+_SLUG_TABLE = {c: None for c in range(128) if not (chr(c).isalnum() or chr(c) in "_-")}
+
+
+def _slug(text):
+    text = (text or "").lower()
+    if text.isascii():
+        return text.translate(_SLUG_TABLE)
+    return _SLUG_RE.sub("", text)
+
+
+def index_file(path: Path, info):
+    # serve_file html-unescapes the requested name, so titles carrying entities ("&amp;")
+    # are keyed by their unescaped form too
+    keys = [path.name, html.unescape(path.name), info.get("id"), _slug(info.get("title")), _slug(path.stem)]
+    with FILE_INDEX_LOCK:
+        for key in keys:
+            if key:
+                FILE_INDEX[key] = path
+                FILE_INDEX.move_to_end(key)
+        while len(FILE_INDEX) > FILE_INDEX_MAX:
+            FILE_INDEX.popitem(last=False)
+
+
+def lookup_indexed_file(name):
+    stem = Path(name).stem
+    # exact filename first; default outtmpl is "<title> - <id>.<ext>"
+    keys = [name, _slug(stem), stem.rsplit(" - ", 1)[-1], _slug(stem.rsplit(" - ", 1)[0])]
+    with FILE_INDEX_LOCK:
+        for key in keys:
+            p = FILE_INDEX.get(key) if key else None
+            if p is None:
+                continue
+            if p.exists():
+                FILE_INDEX.move_to_end(key)
+                return p
+            del FILE_INDEX[key]
+    return None
+
+
+# Records of archived/evicted tasks, reused by new_task() instead of allocating a Task
+# and its deque per download. A record is only reused TASK_REUSE_GRACE seconds after
+# release, so a /task poll that fetched it just before removal still reads its own data.
+_TASK_POOL: deque = deque(maxlen=64)
+TASK_REUSE_GRACE = 30
+
+
+def new_task(url):
+    with TASK_LOCK:
+        if _TASK_POOL and time.time() - _TASK_POOL[0][0] > TASK_REUSE_GRACE:
+            t = _TASK_POOL.popleft()[1]
+        else:
+            t = None
+    if t is None:
+        return Task(status="queued", url=url, created=time.time())
+    t.reset("queued", url, time.time())
+    return t
+
+
+def _release_task(t):
+    # caller holds TASK_LOCK
+    _TASK_POOL.append((time.time(), t))
+
+
+def add_task(task_id, task):
+    """
+    Register a new task. Past MAX_TASKS the oldest finished tasks are dropped;
+    running/queued ones are never evicted (their workers still write to them).
+    """
+    with TASK_LOCK:
+        TASKS[task_id] = task
+        if len(TASKS) > MAX_TASKS:
+            finished = [tid for tid, t in TASKS.items() if t.status in ("done", "error")]
+            for tid in finished[:len(TASKS) - MAX_TASKS]:
+                _release_task(TASKS.pop(tid))
+
+
 def add_task_message(task_id, text):
     t = TASKS.get(task_id)
     if t is None:
         return
-    msgs = t.setdefault("messages", [])
-    msgs.append({"ts": int(time.time()), "text": text})
+    t.messages.append((int(time.time()), text))
 
 
-def run_subprocess(cmd, env=None, timeout=None):
+def _kill_process_group(proc):
+    try:
+        if os.name == "posix":
+            os.killpg(proc.pid, signal.SIGKILL)
+        else:
+            proc.kill()
+    except Exception:
+        pass
+
+
+def _drain_stderr(proc, timeout, tail):
+    """
+    Read proc's stderr lines into tail until it exits (POSIX only).
+    Returns the exit code, or None if timeout seconds passed first.
+    """
+    deadline = time.monotonic() + timeout if timeout else None
+    fd = proc.stderr.fileno()
+    partial = b""
+    with selectors.DefaultSelector() as sel:
+        sel.register(fd, selectors.EVENT_READ)
+        while True:
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return None
+            if not sel.select(remaining):
+                continue
+            chunk = os.read(fd, 65536)
+            if not chunk:
+                break
+            lines = (partial + chunk).split(b"\n")
+            partial = lines.pop()
+            tail.extend(line.decode(errors='ignore') + "\n" for line in lines)
+    if partial:
+        tail.append(partial.decode(errors='ignore'))
+    try:
+        # stderr closed; the exit normally follows immediately
+        return proc.wait(timeout=None if deadline is None else max(deadline - time.monotonic(), 0))
+    except subprocess.TimeoutExpired:
+        return None
+
+
+def run_subprocess(cmd, env=None, timeout=None, capture=True):
+    """
+    Run cmd and return (returncode, stdout, stderr).
+    With capture=False stdout is discarded and only the last 200 stderr lines are
+    kept, so long ffmpeg runs don't buffer their whole log in memory.
+    The child runs in its own session so a timeout kills it with anything it spawned.
+    """
     try:
         if isinstance(cmd, str):
             cmd_list = shlex.split(cmd)
         else:
             cmd_list = cmd
-        proc = subprocess.run(cmd_list, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=False, env=env, timeout=timeout)
-        return proc.returncode, proc.stdout.decode(errors='ignore'), proc.stderr.decode(errors='ignore')
-    except subprocess.TimeoutExpired as e:
-        return 124, "", f"timeout: {e}"
+        popen_kwargs = {"start_new_session": True} if os.name == "posix" else {}
+        if capture:
+            proc = subprocess.Popen(cmd_list, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env, **popen_kwargs)
+            try:
+                out, err = proc.communicate(timeout=timeout)
+            except subprocess.TimeoutExpired:
+                _kill_process_group(proc)
+                proc.communicate()
+                return 124, "", f"timeout: {cmd_list[0]} exceeded {timeout}s"
+            return proc.returncode, out.decode(errors='ignore'), err.decode(errors='ignore')
+
+        tail = deque(maxlen=200)
+        proc = subprocess.Popen(cmd_list, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, env=env, **popen_kwargs)
+        if os.name == "posix":
+            # wait on the pipe with select() in this thread instead of a Timer thread per process
+            try:
+                rc = _drain_stderr(proc, timeout, tail)
+            finally:
+                proc.stderr.close()
+            if rc is None:
+                _kill_process_group(proc)
+                proc.wait()
+                return 124, "", f"timeout: {cmd_list[0]} exceeded {timeout}s"
+            return rc, "", "".join(tail)
+
+        # Windows pipes can't be select()ed; a timer kills the child instead
+        timed_out = threading.Event()
+
+        def kill_on_timeout():
+            timed_out.set()
+            _kill_process_group(proc)
+
+        timer = threading.Timer(timeout, kill_on_timeout) if timeout else None
+        if timer:
+            timer.start()
+        try:
+            for line in proc.stderr:
+                tail.append(line.decode(errors='ignore'))
+            rc = proc.wait()
+        finally:
+            if timer:
+                timer.cancel()
+            proc.stderr.close()
+        if timed_out.is_set():
+            return 124, "", f"timeout: {cmd_list[0]} exceeded {timeout}s"
+        return rc, "", "".join(tail)
+    except FileNotFoundError as e:
+        return 127, "", f"not found: {e}"
     except Exception as e:
         return 1, "", str(e)
 
 
-def find_file_by_info(info):
+# Looked up once at startup instead of spawning ffmpeg per file to find out
+FFMPEG_AVAILABLE = shutil.which("ffmpeg") is not None
+
+
+# Hardware encoder families in order of preference; the encoder name is f"{codec}_{family}"
+HW_ENCODER_FAMILIES = ("nvenc", "qsv", "videotoolbox")
+
+
+def _env_flag(name):
+    return str(os.environ.get(name, "0")).lower() in ("1", "true", "yes")
+
+
+def _encoder_works(name):
+    # one-frame trial encode: distro ffmpeg builds list nvenc/qsv on hosts with no such device
+    rc, _, _ = run_subprocess(["ffmpeg", "-hide_banner", "-loglevel", "error", "-f", "lavfi", "-i", "nullsrc",
+                               "-frames:v", "1", "-c:v", name, "-f", "null", "-"], timeout=15)
+    return rc == 0
+
+
+def _detect_encoders():
+    # Probed once at startup; DISABLE_HW_ENCODER=1 forces the CPU encoders,
+    # DISABLE_NVENC=1 skips only NVENC.
+    if not FFMPEG_AVAILABLE or _env_flag("DISABLE_HW_ENCODER"):
+        return set()
+    rc, out, err = run_subprocess(["ffmpeg", "-hide_banner", "-encoders"], timeout=10)
+    if rc != 0:
+        return set()
+    # lines look like " V....D h264_nvenc   NVIDIA NVENC H.264 encoder"
+    names = {parts[1] for parts in (line.split() for line in out.splitlines()) if len(parts) > 1}
+    if _env_flag("DISABLE_NVENC"):
+        names = {n for n in names if not n.endswith("_nvenc")}
+    candidates = [f"{codec}_{family}" for codec in ("h264", "hevc") for family in HW_ENCODER_FAMILIES
+                  if f"{codec}_{family}" in names]
+    if not candidates:
+        return set()
+    with ThreadPoolExecutor(max_workers=len(candidates)) as ex:
+        return {n for n, ok in zip(candidates, ex.map(_encoder_works, candidates)) if ok}
+
+
+# hardware encoders that both exist in the ffmpeg build and passed a trial encode
+HW_ENCODERS = _detect_encoders()
+
+
+def pick_hw_encoder(video_codec="h264"):
+    """Preferred hardware encoder family available for video_codec, or None for the CPU encoder."""
+    for family in HW_ENCODER_FAMILIES:
+        if f"{video_codec}_{family}" in HW_ENCODERS:
+            return family
+    return None
+
+
+_H264_HW = pick_hw_encoder("h264")
+H264_ENCODER = f"h264_{_H264_HW}" if _H264_HW else "libx264"
+
+
+# Last listing of DOWNLOAD_DIR (plus a stem -> entry map), reused until the directory's mtime changes
+_DIR_CACHE = {"mtime_ns": None, "listing": ([], {}, [])}
+_DIR_LOCK = threading.Lock()
+
+
+def scan_download_dir():
+    return _dir_listing()[0]
+
+
+def find_by_stem(stem):
+    """DirEntry in DOWNLOAD_DIR whose name without extension is stem, or None."""
+    return _dir_listing()[1].get(stem)
+
+
+def find_by_slug(target):
+    """First DirEntry in DOWNLOAD_DIR whose slugged name contains target, or None."""
+    for slug, e in _dir_listing()[2]:
+        if target in slug:
+            return e
+    return None
+
+
+def _dir_listing():
+    """
+    (entries, by_stem, [(slug, entry)]) for the files in DOWNLOAD_DIR. Entries are DirEntry objects (they
+    cache is_file()/stat(), unlike the Path objects from iterdir()). Creating, renaming or deleting a file bumps the
+    directory mtime, so concurrent lookups share one listing until something changes.
+    """
+    d_mtime = DOWNLOAD_DIR.stat().st_mtime_ns
+    with _DIR_LOCK:
+        # a change within the filesystem's timestamp granularity can leave mtime
+        # unchanged, so a directory touched in the last 2s is always rescanned
+        if d_mtime == _DIR_CACHE["mtime_ns"] and time.time_ns() - d_mtime > 2_000_000_000:
+            return _DIR_CACHE["listing"]
+        with os.scandir(DOWNLOAD_DIR) as it:
+            entries = [e for e in it if e.is_file()]
+        by_stem = {}
+        for e in entries:
+            by_stem.setdefault(os.path.splitext(e.name)[0], e)
+        # slugged once per rescan rather than on every fuzzy lookup
+        slugged = [(_slug(e.name), e) for e in entries]
+        _DIR_CACHE["mtime_ns"] = d_mtime
+        _DIR_CACHE["listing"] = (entries, by_stem, slugged)
+        return _DIR_CACHE["listing"]
+
+
+# Only used for prepare_filename(); built once because YoutubeDL() setup is not cheap
+_FN_YDL = yt_dlp.YoutubeDL({"outtmpl": OUT_TEMPLATE, "quiet": True})
+
+
+def find_file_by_info(info, ydl=None):
     try:
-        with yt_dlp.YoutubeDL({}) as ydl:
-            prepared = Path(ydl.prepare_filename(info))
+        prepared = Path((ydl or _FN_YDL).prepare_filename(info))
         if prepared.exists():
             return prepared
         vid = info.get("id")
         title = info.get("title") or ""
+        files = scan_download_dir()
         if vid:
-            for p in DOWNLOAD_DIR.iterdir():
-                if p.is_file() and vid in p.name:
-                    return p
-        slug = "".join(c for c in title if (c.isalnum() or c in " _-")).strip().lower().replace(" ", "")
+            for e in files:
+                if vid in e.name:
+                    return Path(e.path)
+        slug = _slug(title)
         if slug:
-            for p in DOWNLOAD_DIR.iterdir():
-                if p.is_file() and slug in p.name.lower().replace(" ", ""):
-                    return p
-        files = [p for p in DOWNLOAD_DIR.iterdir() if p.is_file()]
+            for e in files:
+                if slug in e.name.lower().replace(" ", ""):
+                    return Path(e.path)
         if files:
-            files.sort(key=lambda x: x.stat().st_mtime, reverse=True)
-            return files[0]
+            # follow_symlinks=False is served from the directory listing on Windows
+            # and is one lstat per entry elsewhere; DirEntry caches it either way
+            newest = max(files, key=lambda e: e.stat(follow_symlinks=False).st_mtime)
+            return Path(newest.path)
     except Exception:
         app.logger.exception("find_file_by_info failed")
     return None
 
 # ---------------- ffprobe / QuickTime compatibility helpers ----------------
-def ffprobe_codecs(path: Path):
-    try:
-        cmd_v = ["ffprobe", "-v", "error", "-select_streams", "v:0",
-                 "-show_entries", "stream=codec_name", "-of", "default=noprint_wrappers=1:nokey=1", str(path)]
-        rc1, outv, errv = run_subprocess(cmd_v, timeout=10)
-        vcodec = outv.strip().splitlines()[0].strip() if rc1 == 0 and outv.strip() else None
+# (path, size, mtime_ns) -> {"video", "audio"}; size/mtime in the key make a rewritten file re-probe
+_FFPROBE_CACHE: dict[tuple, dict] = {}
+_FFPROBE_CACHE_MAX = 512
+_FFPROBE_LOCK = threading.Lock()
+
+
+def forget_probe(path):
+    """Drop cached probe results for a path that is about to be deleted or replaced."""
+    path_str = str(path)
+    with _FFPROBE_LOCK:
+        for key in [k for k in _FFPROBE_CACHE if k[0] == path_str]:
+            del _FFPROBE_CACHE[key]
 
-        cmd_a = ["ffprobe", "-v", "error", "-select_streams", "a:0",
-                 "-show_entries", "stream=codec_name", "-of", "default=noprint_wrappers=1:nokey=1", str(path)]
-        rc2, outa, erra = run_subprocess(cmd_a, timeout=10)
-        acodec = outa.strip().splitlines()[0].strip() if rc2 == 0 and outa.strip() else None
 
+def _probe_with_av(path_str):
+    """Read codec names in-process with PyAV; None if PyAV is missing or cannot open the file."""
+    if not AV_AVAILABLE:
+        return None
+    try:
+        with av.open(path_str) as container:
+            streams = container.streams
+            vcodec = next((s.codec_context.name for s in streams if s.type == "video"), None)
+            acodec = next((s.codec_context.name for s in streams if s.type == "audio"), None)
         return {"video": vcodec, "audio": acodec}
     except Exception:
         return None
 
 
+def _run_ffprobe(path_str):
+    # one process for both codecs, and only the three fields we read instead of every stream property
+    # codec names sit in the container header; cap how far ffprobe scans to find them
+    cmd = ["ffprobe", "-hide_banner", "-v", "error",
+           "-probesize", "1000000", "-analyzeduration", "1000000", "-read_intervals", "%+1",
+           "-show_entries", "stream=index,codec_type,codec_name", "-of", "json", path_str]
+    rc, out, err = run_subprocess(cmd, timeout=10)
+    if rc != 0:
+        return {"video": None, "audio": None}
+    try:
+        streams = json.loads(out or "{}").get("streams") or []
+    except ValueError:
+        streams = []
+    vcodec = None
+    acodec = None
+    for st in streams:
+        ctype = st.get("codec_type")
+        if ctype == "video" and vcodec is None:
+            vcodec = st.get("codec_name")
+        elif ctype == "audio" and acodec is None:
+            acodec = st.get("codec_name")
+    return {"video": vcodec, "audio": acodec}
+
+
+def ffprobe_codecs(path: Path):
+    try:
+        st = path.stat()
+        key = (str(path), st.st_size, st.st_mtime_ns)
+        with _FFPROBE_LOCK:
+            cached = _FFPROBE_CACHE.get(key)
+        if cached is not None:
+            return cached
+        result = _probe_with_av(key[0]) or _run_ffprobe(key[0])
+        with _FFPROBE_LOCK:
+            if len(_FFPROBE_CACHE) >= _FFPROBE_CACHE_MAX:
+                # dicts keep insertion order, so this evicts the oldest probe
+                del _FFPROBE_CACHE[next(iter(_FFPROBE_CACHE))]
+            _FFPROBE_CACHE[key] = result
+        return result
+    except Exception:
+        return None
+
+
+def codecs_from_info(info, path: Path):
+    """
+    Codecs yt-dlp reported for the file it wrote, in ffprobe_codecs() shape.
+    None when the info does not describe this file (e.g. a postprocessor changed the extension).
+    Don't pass info for audio-converted downloads: the extension is updated, the codecs are not.
+    """
+    if not info or path.suffix.lstrip(".").lower() != (info.get("ext") or "").lower():
+        return None
+    vcodec = info.get("vcodec")
+    acodec = info.get("acodec")
+    vcodec = None if vcodec in (None, "none") else vcodec
+    acodec = None if acodec in (None, "none") else acodec
+    if vcodec is None and acodec is None:
+        return None
+    return {"video": vcodec, "audio": acodec}
+
+
 def is_quicktime_compatible(codecs: dict):
     if not codecs:
         return False
@@ -124,6 +608,145 @@ def is_quicktime_compatible(codecs: dict):
     return False
 
 # ---------------- Container choice + remux/re-encode ----------------
+# Every libx264/libx265 encode holds a slot, so concurrent downloads queue for CPU
+# instead of all running ffmpeg at once; CPU encoders get FFMPEG_THREADS each.
+# Stream-copy remuxes and hardware encodes barely use the CPU and are not gated.
+FFMPEG_THREADS = 4
+FFMPEG_SLOTS = max(1, (os.cpu_count() or 1) // FFMPEG_THREADS)
+FFMPEG_SEM = threading.BoundedSemaphore(FFMPEG_SLOTS)
+
+
+def _encode_input_args(src: Path, hw):
+    if hw == "nvenc":
+        return ["-hwaccel", "cuda", "-hwaccel_output_format", "cuda", "-i", str(src)]
+    return ["-i", str(src)]
+
+
+def _encode_output_args(video_codec, hw):
+    if hw == "nvenc":
+        args = ["-c:v", f"{video_codec}_nvenc", "-preset", "p4", "-rc", "vbr", "-cq", "23", "-b:v", "0"]
+    elif hw == "qsv":
+        args = ["-c:v", f"{video_codec}_qsv", "-preset", "medium", "-global_quality", "23"]
+    elif hw == "videotoolbox":
+        args = ["-c:v", f"{video_codec}_videotoolbox", "-q:v", "60"]
+    elif video_codec == "hevc":
+        args = ["-c:v", "libx265", "-preset", "fast", "-crf", "28", "-threads", str(FFMPEG_THREADS)]
+    else:
+        args = ["-c:v", "libx264", "-preset", "fast", "-crf", "23", "-threads", str(FFMPEG_THREADS)]
+    if video_codec == "hevc":
+        # QuickTime only plays HEVC in mp4 when tagged hvc1
+        args += ["-tag:v", "hvc1"]
+    return args + ["-c:a", "aac", "-b:a", "128k", "-movflags", "faststart"]
+
+
+def build_encode_cmd(src: Path, dst: Path, video_codec="h264", hw=None):
+    return (["ffmpeg", "-hide_banner", "-loglevel", "error", "-y"] + _encode_input_args(src, hw)
+            + _encode_output_args(video_codec, hw) + [str(dst)])
+
+
+def build_batch_encode_cmd(pairs, video_codec="h264", hw=None):
+    # N inputs -> N outputs in one process, so ffmpeg startup and encoder init are paid once
+    cmd = ["ffmpeg", "-hide_banner", "-loglevel", "error", "-y"]
+    for src, _ in pairs:
+        cmd += _encode_input_args(src, hw)
+    out_args = _encode_output_args(video_codec, hw)
+    for i, (_, dst) in enumerate(pairs):
+        cmd += ["-map", f"{i}:v:0?", "-map", f"{i}:a:0?"] + out_args + [str(dst)]
+    return cmd
+
+# ---------------- Batched transcoder ----------------
+# Re-encodes are handed to one collector thread. It waits TRANSCODE_BATCH_WINDOW
+# seconds for more jobs, groups jobs with the same settings into one ffmpeg command
+# and hands each group to TRANSCODE_POOL, so up to FFMPEG_SLOTS CPU encodes run at once.
+TRANSCODE_QUEUE = queue.Queue()
+TRANSCODE_POOL = ThreadPoolExecutor(max_workers=FFMPEG_SLOTS, thread_name_prefix="transcode")
+# hardware encodes run on the GPU/media engine, so they get their own pool instead of CPU slots
+HW_TRANSCODE_POOL = ThreadPoolExecutor(max_workers=int(os.environ.get("HW_ENCODE_SESSIONS", "2")),
+                                       thread_name_prefix="hw-transcode")
+# while a caller waits on its job, its task's last_progress_time is refreshed this often
+TRANSCODE_HEARTBEAT = 30
+TRANSCODE_BATCH_WINDOW = 0.5
+TRANSCODE_MAX_BATCH = int(os.environ.get("TRANSCODE_MAX_BATCH", "4"))
+TRANSCODE_TIMEOUT = 60*60
+TRANSCODER = {"thread": None}
+TRANSCODER_LOCK = threading.Lock()
+
+
+def run_transcode_batch(settings, jobs):
+    video_codec, hw = settings
+    if len(jobs) == 1:
+        cmd = build_encode_cmd(jobs[0]["src"], jobs[0]["dst"], video_codec, hw)
+    else:
+        cmd = build_batch_encode_cmd([(j["src"], j["dst"]) for j in jobs], video_codec, hw)
+    if app.logger.isEnabledFor(logging.INFO):
+        app.logger.info("Encode cmd: %s", shlex.join(cmd))
+    with (contextlib.nullcontext() if hw else FFMPEG_SEM):
+        result = run_subprocess(cmd, timeout=TRANSCODE_TIMEOUT * len(jobs), capture=False)
+    if result[0] != 0 and len(jobs) > 1:
+        # one bad input fails the whole command; redo each job on its own
+        app.logger.warning("Batched encode of %d files failed rc=%s; retrying individually", len(jobs), result[0])
+        for j in jobs:
+            run_transcode_batch(settings, [j])
+        return
+    for j in jobs:
+        j["result"] = result
+        j["done"].set()
+
+
+def _run_transcode_group(settings, jobs):
+    try:
+        run_transcode_batch(settings, jobs)
+    except Exception as e:
+        app.logger.exception("transcoder error")
+        for j in jobs:
+            if not j["done"].is_set():
+                j["result"] = (1, "", str(e))
+                j["done"].set()
+
+
+def transcoder():
+    while True:
+        batch = [TRANSCODE_QUEUE.get()]
+        deadline = time.time() + TRANSCODE_BATCH_WINDOW
+        while len(batch) < TRANSCODE_MAX_BATCH:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(TRANSCODE_QUEUE.get(timeout=remaining))
+            except queue.Empty:
+                break
+        groups = {}
+        for job in batch:
+            groups.setdefault(job["settings"], []).append(job)
+        for settings, jobs in groups.items():
+            pool = HW_TRANSCODE_POOL if settings[1] else TRANSCODE_POOL
+            pool.submit(_run_transcode_group, settings, jobs)
+
+
+def transcode(src: Path, dst: Path, video_codec="h264", hw=None, task_id=None):
+    """
+    Queue a re-encode of src into dst and block until it finishes.
+    Returns (returncode, stdout, stderr) like run_subprocess.
+    Time spent queued or encoding is progress as far as the stall monitor is
+    concerned, so task_id's last_progress_time is kept fresh meanwhile.
+    """
+    with TRANSCODER_LOCK:
+        if TRANSCODER["thread"] is None:
+            th = threading.Thread(target=transcoder, name="transcoder", daemon=True)
+            th.start()
+            TRANSCODER["thread"] = th
+    job = {"src": src, "dst": dst, "settings": (video_codec, hw),
+           "done": threading.Event(), "result": None}
+    TRANSCODE_QUEUE.put(job)
+    # ffmpeg's own TRANSCODE_TIMEOUT bounds this wait
+    while not job["done"].wait(TRANSCODE_HEARTBEAT):
+        t = TASKS.get(task_id) if task_id else None
+        if t is not None:
+            t.last_progress_time = time.time()
+    return job["result"]
+
+
 def choose_best_container(info):
     vcodec = (info.get("vcodec") or "").lower()
     acodec = (info.get("acodec") or "").lower()
@@ -148,97 +771,137 @@ def choose_best_container(info):
     return "mp4"
 
 
-def remux_or_encode(task_id, src_path: Path, desired_ext: str, reencode_on_fail=True):
+def choose_format(info):
+    """
+    Resolve concrete format ids from already-extracted info: the best progressive
+    stream when it is at least as tall as the best video-only one, else that video
+    plus the best audio (only when ffmpeg can merge them). yt-dlp lists formats
+    worst to best, so the last match of each kind wins. None means "let yt-dlp pick".
+    """
+    video = audio = muxed = None
+    for f in reversed(info.get("formats") or []):
+        if f.get("has_drm") or not f.get("format_id"):
+            continue
+        has_v = f.get("vcodec") != "none"
+        has_a = f.get("acodec") != "none"
+        if has_v and has_a:
+            muxed = muxed or f
+        elif has_v:
+            video = video or f
+        elif has_a:
+            audio = audio or f
+    if muxed and (not video or (muxed.get("height") or 0) >= (video.get("height") or 0)):
+        return str(muxed["format_id"])
+    if video and audio and FFMPEG_AVAILABLE:
+        return f"{video['format_id']}+{audio['format_id']}"
+    return str(muxed["format_id"]) if muxed else None
+
+
+def reserve_output_path(base, ext):
+    # mkstemp creates the name with O_EXCL: no exists() probing and no clash between workers
+    fd, name = tempfile.mkstemp(dir=str(DOWNLOAD_DIR), prefix=f"{base}-", suffix=f".{ext}")
+    os.close(fd)
+    return Path(name)
+
+
+def remux_or_encode(task_id, src_path: Path, desired_ext: str, info=None, reencode_on_fail=True, video_codec="h264",
+                    codecs=None):
+    """
+    Make src_path QuickTime-friendly as .desired_ext: stream-copy remux when that can
+    be enough, else re-encode. codecs (ffprobe_codecs() shape) spares a probe when the
+    caller already knows them.
+    """
     try:
         add_task_message(task_id, f"Preparing container: target .{desired_ext}")
+        if not FFMPEG_AVAILABLE:
+            add_task_message(task_id, "ffmpeg not available; cannot remux/re-encode. Serving original.")
+            return src_path
         cur_ext = src_path.suffix.lstrip(".").lower()
+        codecs = codecs or codecs_from_info(info, src_path)
         if cur_ext == desired_ext:
             add_task_message(task_id, f"File already .{cur_ext}; checking codecs for compatibility...")
-            codecs = ffprobe_codecs(src_path)
+            codecs = codecs or ffprobe_codecs(src_path)
             if codecs and is_quicktime_compatible(codecs):
                 add_task_message(task_id, "Already QuickTime-compatible; no action needed.")
                 return src_path
 
-        rc, out, err = run_subprocess(["ffmpeg", "-version"])
-        if rc != 0:
-            add_task_message(task_id, "ffmpeg not available; cannot remux/re-encode. Serving original.")
-            app.logger.warning("ffmpeg not available: %s", err)
-            return src_path
-
         base = src_path.stem
-        outname = DOWNLOAD_DIR / f"{base}.{desired_ext}"
-        i = 1
-        while outname.exists():
-            outname = DOWNLOAD_DIR / f"{base}-{i}.{desired_ext}"
-            i += 1
-
-        add_task_message(task_id, "Attempting fast remux (stream copy) via ffmpeg...")
-        cmd = ["ffmpeg", "-y", "-i", str(src_path), "-c", "copy"]
-        if desired_ext == "mp4":
-            cmd += ["-movflags", "faststart"]
-        cmd += [str(outname)]
-        app.logger.info("Remux cmd: %s", " ".join(shlex.quote(p) for p in cmd))
-        rc1, cout1, cerr1 = run_subprocess(cmd, timeout=300)
-
-        if rc1 == 0 and outname.exists():
-            add_task_message(task_id, f"Remuxed to {outname.name}. Verifying codecs...")
-            codecs = ffprobe_codecs(outname)
-            if codecs and is_quicktime_compatible(codecs):
-                add_task_message(task_id, "Remux result QuickTime-compatible.")
-                try:
-                    src_path.unlink()
-                    add_task_message(task_id, f"Removed original {src_path.name}")
-                except Exception:
-                    add_task_message(task_id, f"Could not remove original {src_path.name} (kept).")
-                return outname
-            else:
-                add_task_message(task_id, "Remuxed file not QuickTime-compatible (codecs mismatch). Will fallback to re-encode if allowed.")
+        outname = None
+
+        if codecs and not is_quicktime_compatible(codecs):
+            # A stream-copy cannot change the codecs; remuxing would only cost a pass over the file
+            add_task_message(task_id, "Codecs are not QuickTime-compatible; skipping remux.")
         else:
-            add_task_message(task_id, "Fast remux failed or errored; will fallback to re-encode if allowed.")
-            app.logger.warning("Remux failed rc=%s stderr=%s", rc1, cerr1)
+            add_task_message(task_id, "Attempting fast remux (stream copy) via ffmpeg...")
+            outname = reserve_output_path(base, desired_ext)
+            cmd = ["ffmpeg", "-hide_banner", "-loglevel", "error", "-y", "-i", str(src_path), "-c", "copy"]
+            if desired_ext == "mp4":
+                # this is the deliverable: keep a global moov index up front (as yt-dlp's
+                # merges and the encodes do), which QuickTime needs for seeking and import
+                cmd += ["-movflags", "faststart"]
+            cmd += [str(outname)]
+            if app.logger.isEnabledFor(logging.INFO):
+                app.logger.info("Remux cmd: %s", shlex.join(cmd))
+            rc1, cout1, cerr1 = run_subprocess(cmd, timeout=300, capture=False)
+            if rc1 == 127:
+                _unlink_quiet(outname)
+                add_task_message(task_id, "ffmpeg not available; cannot remux/re-encode. Serving original.")
+                app.logger.warning("ffmpeg not available: %s", cerr1)
+                return src_path
+
+            if rc1 == 0 and outname.stat().st_size > 0:
+                add_task_message(task_id, f"Remuxed to {outname.name}. Verifying codecs...")
+                codecs = ffprobe_codecs(outname)
+                if codecs and is_quicktime_compatible(codecs):
+                    add_task_message(task_id, "Remux result QuickTime-compatible.")
+                    forget_probe(src_path)
+                    try:
+                        src_path.unlink()
+                        add_task_message(task_id, f"Removed original {src_path.name}")
+                    except Exception:
+                        add_task_message(task_id, f"Could not remove original {src_path.name} (kept).")
+                    return outname
+                else:
+                    add_task_message(task_id, "Remuxed file not QuickTime-compatible (codecs mismatch). Will fallback to re-encode if allowed.")
+            else:
+                add_task_message(task_id, "Fast remux failed or errored; will fallback to re-encode if allowed.")
+                app.logger.warning("Remux failed rc=%s stderr=%s", rc1, cerr1)
+                _unlink_quiet(outname)
+                outname = None
 
         if not reencode_on_fail:
             add_task_message(task_id, "Re-encode disabled; returning best available file.")
-            if outname.exists():
-                return outname
-            return src_path
-
-        add_task_message(task_id, "Re-encoding to H.264 + AAC (.mp4). This may take long for large files.")
-        enc_out = DOWNLOAD_DIR / f"{base}.mp4"
-        j = 1
-        while enc_out.exists():
-            enc_out = DOWNLOAD_DIR / f"{base}-{j}.mp4"
-            j += 1
-
-        encode_cmd = [
-            "ffmpeg", "-y", "-i", str(outname if outname.exists() else src_path),
-            "-c:v", "libx264", "-preset", "fast", "-crf", "23",
-            "-c:a", "aac", "-b:a", "128k",
-            "-movflags", "faststart",
-            str(enc_out)
-        ]
-        app.logger.info("Encode cmd: %s", " ".join(shlex.quote(p) for p in encode_cmd))
-        rc2, cout2, cerr2 = run_subprocess(encode_cmd, timeout=60*60)
-        if rc2 == 0 and enc_out.exists():
+            return outname or src_path
+
+        codec_label = "HEVC" if video_codec == "hevc" else "H.264"
+        hw = pick_hw_encoder(video_codec)
+        encoder_label = hw.upper() if hw else "CPU"
+        add_task_message(task_id, f"Re-encoding to {codec_label} + AAC (.mp4) using {encoder_label} encoder. This may take long for large files.")
+        enc_out = reserve_output_path(base, "mp4")
+        encode_src = outname or src_path
+        rc2, cout2, cerr2 = transcode(encode_src, enc_out, video_codec, hw=hw, task_id=task_id)
+        if rc2 != 0 and hw:
+            # hardware encoders can reject some inputs (e.g. AV1 decode on older GPUs)
+            add_task_message(task_id, f"{encoder_label} encode failed; retrying with CPU encoder.")
+            app.logger.warning("%s encode failed rc=%s stderr=%s", encoder_label, rc2, cerr2)
+            rc2, cout2, cerr2 = transcode(encode_src, enc_out, video_codec, hw=None, task_id=task_id)
+        if rc2 == 0 and enc_out.stat().st_size > 0:
             add_task_message(task_id, f"Re-encode successful -> {enc_out.name}")
+            forget_probe(src_path)
             try:
                 if src_path.exists():
                     src_path.unlink()
                     add_task_message(task_id, f"Removed original {src_path.name}")
             except Exception:
                 add_task_message(task_id, f"Could not remove original {src_path.name}")
-            try:
-                if outname.exists() and outname != enc_out:
-                    outname.unlink()
-            except Exception:
-                pass
+            if outname:
+                _unlink_quiet(outname)
             return enc_out
         else:
             add_task_message(task_id, "Re-encode failed. Keeping best available file.")
             app.logger.warning("Encode failed rc=%s stderr=%s", rc2, cerr2)
-            if outname.exists():
-                return outname
-            return src_path
+            _unlink_quiet(enc_out)
+            return outname or src_path
 
     except Exception as e:
         app.logger.exception("remux_or_encode exception: %s", e)
@@ -247,78 +910,117 @@ def remux_or_encode(task_id, src_path: Path, desired_ext: str, reencode_on_fail=
 
 # ---------------- Cookie helpers ----------------
 
+def _looks_netscape(head: bytes) -> bool:
+    return b"# Netscape" in head or b"\t" in head
+
+
 def is_netscape_format(path: str) -> bool:
+    # one binary read of the head; no text decoding or line iteration
     try:
-        with open(path, "r", encoding="utf-8", errors="ignore") as fh:
-            head = "".join([next(fh) for _ in range(5)])
-            if "# Netscape" in head or "\t" in head:
-                return True
-    except StopIteration:
-        pass
+        with open(path, "rb") as fh:
+            return _looks_netscape(fh.read(4096))
     except Exception:
-        pass
-    return False
+        return False
 
 
-def json_to_netscape(json_path: str, out_path: str) -> bool:
+# exporters disagree on the expiry field name; the first non-empty one wins
+_COOKIE_EXPIRY_KEYS = ("expirationDate", "expires", "expiry", "expire")
+
+
+def netscape_from_json(data) -> str | None:
     """
-    Convert cookie JSON (common exporter formats) to Netscape cookies.txt lines.
-    Returns True on success.
+    Convert parsed cookie JSON (common exporter formats) to Netscape cookies.txt text.
+    Returns None when no cookie list is found.
     """
-    try:
-        with open(json_path, "r", encoding="utf-8") as fh:
-            data = json.load(fh)
-    except Exception:
-        return False
-
     lst = None
     if isinstance(data, list):
         lst = data
-    elif isinstance(data, dict) and "cookies" in data and isinstance(data["cookies"], list):
-        lst = data["cookies"]
-    else:
-        # try to find list value
-        for v in data.values():
-            if isinstance(v, list):
-                lst = v
-                break
+    elif isinstance(data, dict):
+        if isinstance(data.get("cookies"), list):
+            lst = data["cookies"]
+        else:
+            # try to find list value
+            for v in data.values():
+                if isinstance(v, list):
+                    lst = v
+                    break
     if not lst:
-        return False
+        return None
 
-    lines = ["# Netscape HTTP Cookie File"]
+    sio = io.StringIO()
+    write = sio.write
+    get = dict.get
+    write("# Netscape HTTP Cookie File\n")
     for c in lst:
         try:
-            domain = c.get("domain") or c.get("host") or ""
-            path = c.get("path", "/")
-            secure = "TRUE" if str(c.get("secure", False)).lower() in ("true", "1") else "FALSE"
-            exp = c.get("expirationDate") or c.get("expires") or c.get("expiry") or c.get("expire")
-            if exp is None:
-                exp_val = "0"
-            else:
-                try:
-                    exp_val = str(int(float(exp)))
-                except Exception:
-                    exp_val = "0"
-            name = c.get("name", "")
-            value = c.get("value", "")
+            domain = get(c, "domain") or get(c, "host") or ""
+            path = get(c, "path", "/")
+            secure = "TRUE" if str(get(c, "secure", False)).lower() in ("true", "1") else "FALSE"
+            exp_val = "0"
+            for key in _COOKIE_EXPIRY_KEYS:
+                exp = get(c, key)
+                if exp:
+                    try:
+                        exp_val = str(int(float(exp)))
+                    except Exception:
+                        pass
+                    break
             flag = "TRUE" if domain.startswith(".") else "FALSE"
-            lines.append(f"{domain}\t{flag}\t{path}\t{secure}\t{exp_val}\t{name}\t{value}")
+            write("\t".join((domain, flag, path, secure, exp_val, str(get(c, "name", "")), str(get(c, "value", "")))))
+            write("\n")
         except Exception:
             continue
+    return sio.getvalue()
+
+
+def json_to_netscape(json_path: str, out_path: str) -> bool:
+    """
+    Convert a cookie JSON file to a Netscape cookies.txt file.
+    Returns True on success.
+    """
+    try:
+        with open(json_path, "r", encoding="utf-8") as fh:
+            text = netscape_from_json(json_loads(fh.read()))
+    except Exception:
+        return False
+    if text is None:
+        return False
     try:
         with open(out_path, "w", encoding="utf-8") as fh:
-            fh.write("\n".join(lines) + "\n")
+            fh.write(text)
         return True
     except Exception:
         return False
 
 
-def make_cookiefile_from_env() -> str | None:
+def _write_temp_cookiefile(data: bytes) -> str:
+    # one mkstemp + write instead of NamedTemporaryFile, close and reopen
+    fd, path = tempfile.mkstemp(suffix=".txt")
+    try:
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+    finally:
+        os.close(fd)
+    return path
+
+
+def _cookies_as_netscape(data: bytes) -> bytes | None:
+    """data unchanged if it already looks like cookies.txt, else converted from JSON, else None."""
+    if _looks_netscape(data[:4096]):
+        return data
+    try:
+        text = netscape_from_json(json_loads(data))
+    except Exception:
+        return None
+    return text.encode("utf-8") if text is not None else None
+
+
+def _build_cookiefile_from_env() -> str | None:
     """
     Create a temp cookies.txt file from env var YTDLP_COOKIES (raw content),
     YTDLP_COOKIES_FILE, or base64 var YTDLP_COOKIES_B64.
     Returns path to cookiefile, or None.
-    Caller should unlink returned path when done.
     """
     # 1) explicit file path env
     file_path = os.environ.get("YTDLP_COOKIES_FILE")
@@ -327,45 +1029,20 @@ def make_cookiefile_from_env() -> str | None:
             # validate netscape, if not and looks like json try conversion
             if is_netscape_format(file_path):
                 return file_path
-            else:
-                # try convert json to netscape into tmp file
-                tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".txt")
-                tmp.close()
-                ok = json_to_netscape(file_path, tmp.name)
-                if ok:
-                    return tmp.name
-                else:
-                    try:
-                        os.unlink(tmp.name)
-                    except Exception:
-                        pass
-                    return None
+            try:
+                with open(file_path, "rb") as fh:
+                    converted = _cookies_as_netscape(fh.read())
+            except Exception:
+                return None
+            return _write_temp_cookiefile(converted) if converted is not None else None
 
     # 2) base64 env var - preferred for UI newline issues
     b64 = os.environ.get("YTDLP_COOKIES_B64")
     if b64:
         try:
             data = base64.b64decode(b64)
-            tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".txt")
-            tmp.close()
-            with open(tmp.name, "wb") as fh:
-                fh.write(data)
-            # validate
-            if is_netscape_format(tmp.name):
-                return tmp.name
-            # try json convert
-            conv_tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".txt")
-            conv_tmp.close()
-            ok = json_to_netscape(tmp.name, conv_tmp.name)
-            if ok:
-                try:
-                    os.unlink(tmp.name)
-                except Exception:
-                    pass
-                return conv_tmp.name
-            else:
-                # keep original (maybe still valid)
-                return tmp.name
+            # keep original if conversion fails (maybe still valid)
+            return _write_temp_cookiefile(_cookies_as_netscape(data) or data)
         except Exception:
             return None
 
@@ -373,33 +1050,151 @@ def make_cookiefile_from_env() -> str | None:
     raw = os.environ.get("YTDLP_COOKIES")
     if raw:
         try:
-            tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".txt")
-            tmp.close()
-            with open(tmp.name, "w", encoding="utf-8") as fh:
-                fh.write(raw)
-            if is_netscape_format(tmp.name):
-                return tmp.name
-            # try json->netscape
-            conv_tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".txt")
-            conv_tmp.close()
-            ok = json_to_netscape(tmp.name, conv_tmp.name)
-            if ok:
-                try:
-                    os.unlink(tmp.name)
-                except Exception:
-                    pass
-                return conv_tmp.name
-            return tmp.name
+            data = raw.encode("utf-8")
+            return _write_temp_cookiefile(_cookies_as_netscape(data) or data)
         except Exception:
-            try:
-                os.unlink(tmp.name)
-            except Exception:
-                pass
             return None
 
     return None
 
+@functools.lru_cache(maxsize=1)
+def _env_cookiefile():
+    path = _build_cookiefile_from_env()
+    if path and path != os.environ.get("YTDLP_COOKIES_FILE"):
+        atexit.register(_unlink_quiet, path)
+    return path
+
+
+def make_cookiefile_from_env() -> str | None:
+    """
+    Cookiefile built from the YTDLP_COOKIES* env vars, or None.
+    The env doesn't change while the process runs, so the file is built once and
+    shared; callers must not unlink it (it is removed at exit) and must give each
+    YoutubeDL a _copy_cookiefile() of it, since yt-dlp rewrites its cookiefile on close.
+    """
+    path = _env_cookiefile()
+    if path and not os.path.exists(path):
+        # someone cleaned the temp dir under us; rebuild
+        _env_cookiefile.cache_clear()
+        path = _env_cookiefile()
+    return path
+
+
+def _copy_cookiefile(path):
+    """
+    Private temp copy of a cookiefile for one YoutubeDL, or None. yt-dlp rewrites its
+    cookiefile when it closes, which must not touch the shared env/browser files or
+    recreate an uploaded one after the request removed it.
+    """
+    if not path:
+        return None
+    fd, copy = tempfile.mkstemp(prefix="ydl-cookies-", suffix=".txt")
+    try:
+        with os.fdopen(fd, "wb") as out, open(path, "rb") as src:
+            shutil.copyfileobj(src, out)
+    except Exception:
+        _unlink_quiet(copy)
+        return None
+    return copy
+
+
+def export_browser_cookies_for_domain(domain: str, out_path: str) -> bool:
+    """
+    Export local browser cookies for domain into a Netscape cookies.txt.
+    Returns True if at least one cookie was written.
+    """
+    import browser_cookie3
+    cj = browser_cookie3.load(domain_name=domain)
+    lines = ["# Netscape HTTP Cookie File"]
+    for c in cj:
+        flag = "TRUE" if c.domain.startswith(".") else "FALSE"
+        secure = "TRUE" if c.secure else "FALSE"
+        lines.append(f"{c.domain}\t{flag}\t{c.path}\t{secure}\t{int(c.expires or 0)}\t{c.name}\t{c.value}")
+    if len(lines) == 1:
+        return False
+    with open(out_path, "w", encoding="utf-8") as fh:
+        fh.write("\n".join(lines) + "\n")
+    return True
+
+
+# Browser cookie exports are reused for BROWSER_COOKIES_TTL seconds; reading the
+# browser store means SQLite reads plus keychain decryption on every call.
+BROWSER_COOKIES_TTL = 600
+_BROWSER_COOKIES_CACHE = {}  # domain -> {"path": str, "ts": float}
+_BROWSER_COOKIES_LOCK = threading.Lock()
+
+
+def browser_cookiefile(domain="youtube.com"):
+    if not BROWSER_COOKIE3_AVAILABLE:
+        return None
+    with _BROWSER_COOKIES_LOCK:
+        entry = _BROWSER_COOKIES_CACHE.get(domain)
+        if entry and time.time() - entry["ts"] < BROWSER_COOKIES_TTL and os.path.exists(entry["path"]):
+            return entry["path"]
+        if entry:
+            path = entry["path"]
+        else:
+            # kept outside DOWNLOAD_DIR so /download_file can never serve it
+            fd, path = tempfile.mkstemp(prefix="browser-cookies-", suffix=".txt")
+            os.close(fd)
+            # reused across requests, so it lives until exit like the env cookiefile
+            atexit.register(_unlink_quiet, path)
+        try:
+            ok = export_browser_cookies_for_domain(domain, path)
+        except Exception:
+            app.logger.exception("browser cookie export failed")
+            ok = False
+        if not ok:
+            _BROWSER_COOKIES_CACHE.pop(domain, None)
+            _unlink_quiet(path)
+            return None
+        _BROWSER_COOKIES_CACHE[domain] = {"path": path, "ts": time.time()}
+        return path
+
 # ---------------- yt-dlp options ----------------
+def _probe_bandwidth():
+    """
+    Link bandwidth in Mbit/s: DL_BW_MBPS if set, otherwise a one-second timed
+    read of DL_BW_PROBE_URL when configured. Returns None when unknown.
+    """
+    env_bw = os.environ.get("DL_BW_MBPS")
+    if env_bw:
+        try:
+            return float(env_bw)
+        except ValueError:
+            pass
+    probe_url = os.environ.get("DL_BW_PROBE_URL")
+    if not probe_url:
+        return None
+    try:
+        got = 0
+        start = time.time()
+        with urllib.request.urlopen(probe_url, timeout=5) as resp:
+            while time.time() - start < 1.0:
+                chunk = resp.read(65536)
+                if not chunk:
+                    break
+                got += len(chunk)
+        return got * 8 / max(time.time() - start, 0.001) / 1e6
+    except Exception:
+        return None
+
+
+def _clamp(value, lo, hi):
+    return max(lo, min(hi, value))
+
+
+# Fragment parallelism and chunk size scale with the measured link; defaults match
+# the old hardcoded values when bandwidth is unknown.
+LINK_MBPS = _probe_bandwidth()
+if LINK_MBPS:
+    CONCURRENT_FRAGMENTS = _clamp(int(LINK_MBPS / 20), 4, 16)
+    HTTP_CHUNK_SIZE = _clamp(int(LINK_MBPS * 16 * 1024), 1 << 20, 16 << 20)
+else:
+    CONCURRENT_FRAGMENTS = 5
+    HTTP_CHUNK_SIZE = 1 << 20
+
+
 def prepare_yt_dlp_opts(cookiefile=None, output_template=None, allow_unplayable=False,
                         extra_headers=None, progress_hook=None, format_override=None,
                         audio_convert=None, merge_output_format="mp4"):
@@ -417,12 +1212,12 @@ def prepare_yt_dlp_opts(cookiefile=None, output_template=None, allow_unplayable=
         "quiet": True,
         "no_warnings": True,
         "outtmpl": output_template or str(DOWNLOAD_DIR / "%(title)s - %(id)s.%(ext)s"),
-        "concurrent_fragment_downloads": 5,
+        "concurrent_fragment_downloads": CONCURRENT_FRAGMENTS,
         "fragment_retries": 10,
         "retries": 5,
         "socket_timeout": 60,
         "continuedl": True,
-        "http_chunk_size": 1048576,
+        "http_chunk_size": HTTP_CHUNK_SIZE,
         "postprocessors": [],
         "nocheckcertificate": True,
         "geo_bypass": True,
@@ -443,6 +1238,9 @@ def prepare_yt_dlp_opts(cookiefile=None, output_template=None, allow_unplayable=
         }]
         opts.pop("postprocessor_args", None)
         opts.pop("merge_output_format", None)
+    elif merge_output_format == "mp4":
+        # single-file formats (e.g. webm "best") get remuxed by yt-dlp in the same ffmpeg pass
+        opts["postprocessors"].append({"key": "FFmpegVideoRemuxer", "preferedformat": "mp4"})
 
     if cookiefile:
         opts["cookiefile"] = cookiefile
@@ -455,83 +1253,127 @@ def prepare_yt_dlp_opts(cookiefile=None, output_template=None, allow_unplayable=
     return opts
 
 
-def run_ydl_extract(url, opts):
+def run_ydl_extract(url, cookiefile=None, private=False, **opt_kwargs):
+    # the extraction gets its own copy of cookiefile, removed once yt-dlp has saved into it;
+    # private=True means cookiefile already is such a copy and its owner removes it
+    cookie_copy = cookiefile if private else _copy_cookiefile(cookiefile)
     try:
-        with yt_dlp.YoutubeDL(opts) as ydl:
+        with yt_dlp.YoutubeDL(prepare_yt_dlp_opts(cookiefile=cookie_copy, **opt_kwargs)) as ydl:
             info = ydl.extract_info(url, download=False)
             return {"ok": True, "info": info}
     except Exception as e:
         return {"ok": False, "error": str(e)}
+    finally:
+        if cookie_copy and not private:
+            _unlink_quiet(cookie_copy)
+
+
+# Seconds the anonymous extraction runs alone before the cookie attempts are started
+# alongside it; most public URLs resolve well within this without touching cookies.
+EXTRACT_HEDGE_DELAY = float(os.environ.get("EXTRACT_HEDGE_DELAY", "2"))
 
 
 def yt_extract_info(url, cookiefile=None, try_browser_cookies=False):
     attempts = []
-    # 0) try with no cookies
-    opts = prepare_yt_dlp_opts()
-    r1 = run_ydl_extract(url, opts)
-    attempts.append(("no_cookies", r1))
-    if r1.get("ok"):
-        return {"info": r1["info"], "attempts": attempts}
-
-    created_env_cookie = None
-    # 1) try uploaded cookiefile if provided
+    # 0-2) no cookies, the uploaded cookiefile and env cookies are independent network
+    # round trips; the cookie ones are a hedge, started only if the anonymous attempt
+    # fails or is still running after EXTRACT_HEDGE_DELAY, then the first success wins
+    candidates = []
     if cookiefile:
-        opts = prepare_yt_dlp_opts(cookiefile=cookiefile)
-        r2 = run_ydl_extract(url, opts)
-        attempts.append(("user_cookiefile", r2))
-        if r2.get("ok"):
-            return {"info": r2["info"], "attempts": attempts}
-
-    # 2) try env-provided cookies
+        candidates.append(("user_cookiefile", cookiefile))
     env_cookie_path = make_cookiefile_from_env()
-    if env_cookie_path:
-        created_env_cookie = env_cookie_path
-        opts = prepare_yt_dlp_opts(cookiefile=env_cookie_path)
-        r_env = run_ydl_extract(url, opts)
-        attempts.append(("env_cookiefile", r_env))
-        if r_env.get("ok"):
-            return {"info": r_env["info"], "attempts": attempts}
+    if env_cookie_path and env_cookie_path != cookiefile:
+        candidates.append(("env_cookiefile", env_cookie_path))
+
+    pool = ThreadPoolExecutor(max_workers=len(candidates) + 1, thread_name_prefix="extract")
+    futures = {pool.submit(run_ydl_extract, url): "no_cookies"}
+    first_error = None
+    try:
+        if candidates:
+            done, _ = wait(futures, timeout=EXTRACT_HEDGE_DELAY)
+            if not any(fut.result().get("ok") for fut in done):
+                # snapshot the cookiefile here, not in the pool thread: a loser may still be
+                # starting when the caller deletes its uploaded file after we return
+                for name, path in candidates:
+                    copy = _copy_cookiefile(path)
+                    fut = pool.submit(run_ydl_extract, url, copy, private=True)
+                    fut.add_done_callback(lambda _f, c=copy: _unlink_quiet(c) if c else None)
+                    futures[fut] = name
+        for fut in as_completed(futures):
+            res = fut.result()
+            attempts.append((futures[fut], res))
+            if res.get("ok"):
+                return {"info": res["info"], "attempts": attempts}
+            if futures[fut] == "no_cookies":
+                first_error = res.get("error")
+    finally:
+        # the losers cannot be interrupted mid-request; let them finish in the background
+        pool.shutdown(wait=False, cancel_futures=True)
+
     # 3) try browser cookies if allowed
-    if try_browser_cookies and BROWSER_COOKIE3_AVAILABLE:
-        tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".txt")
-        tmp.close()
-        ok = False
-        try:
-            ok = export_browser_cookies_for_domain("youtube.com", tmp.name)
-        except Exception:
-            ok = False
-        if ok:
-            opts = prepare_yt_dlp_opts(cookiefile=tmp.name)
-            r3 = run_ydl_extract(url, opts)
+    if try_browser_cookies:
+        browser_path = browser_cookiefile("youtube.com")
+        if browser_path:
+            r3 = run_ydl_extract(url, browser_path)
             attempts.append(("browser_cookiefile", r3))
-            try:
-                os.unlink(tmp.name)
-            except Exception:
-                pass
             if r3.get("ok"):
                 return {"info": r3["info"], "attempts": attempts}
 
     # 4) last: allow unplayable fallback
-    env_cookie_for_cleanup = created_env_cookie
-    opts = prepare_yt_dlp_opts(cookiefile=created_env_cookie, allow_unplayable=True)
-    r4 = run_ydl_extract(url, opts)
+    r4 = run_ydl_extract(url, cookiefile or env_cookie_path, allow_unplayable=True)
     attempts.append(("allow_unplayable", r4))
     if r4.get("ok"):
-        if created_env_cookie:
-            try:
-                os.unlink(created_env_cookie)
-            except Exception:
-                pass
         return {"info": r4["info"], "attempts": attempts}
 
-    # cleanup env cookiefile if created
-    if created_env_cookie:
-        try:
-            os.unlink(created_env_cookie)
-        except Exception:
-            pass
+    return {"error": r4.get("error") or first_error, "attempts": attempts}
+
+
+def _with_uploaded_cookies(stack):
+    """
+    Return the cookiefile for this request: the uploaded "cookies" file streamed
+    straight to a temp file, else the shared one built from the environment, else None.
+    Uploaded files are registered on stack (a contextlib.ExitStack) for removal.
+    """
+    if "cookies" in request.files:
+        fd, path = tempfile.mkstemp(suffix=".txt")
+        stack.callback(_unlink_quiet, path)
+        with os.fdopen(fd, "wb") as out:
+            shutil.copyfileobj(request.files["cookies"].stream, out, length=1 << 20)
+        return path
+    return make_cookiefile_from_env()
+
+
+def ojson(obj, status=200):
+    resp = jsonify(obj)
+    resp.status_code = status
+    return resp
+
+
+# Only what the format picker reads; raw yt-dlp formats carry ~40 keys each
+# (http_headers, fragments, manifest urls...).
+FORMAT_COLUMNS = ("format_id", "ext", "format_note", "width", "height", "fps",
+                  "vcodec", "acodec", "abr", "vbr", "filesize")
+
+
+def formats_columns(formats):
+    """
+    Column-oriented {key: [value per format]} view of yt-dlp formats; filesize
+    falls back to filesize_approx. Row i is {k: cols[k][i]}.
+    """
+    cols = {k: [] for k in FORMAT_COLUMNS}
+    appenders = [(k, cols[k].append) for k in FORMAT_COLUMNS if k != "filesize"]
+    add_size = cols["filesize"].append
+    for f in formats:
+        get = f.get
+        for k, append in appenders:
+            append(get(k))
+        add_size(get("filesize") or get("filesize_approx"))
+    return cols
 
-    return {"error": r4.get("error") or r1.get("error"), "attempts": attempts}
+
+def attempts_summary(result):
+    # the raw attempts hold whole info dicts; the client only needs outcome per strategy
+    return [(name, {"ok": bool(r.get("ok")), "error": r.get("error")}) for name, r in result.get("attempts", [])]
 
 
 def get_request_param(key, default=None):
@@ -545,6 +1387,155 @@ def get_request_param(key, default=None):
         pass
     return request.args.get(key, default)
 
+# ---------------- Finished-task archive ----------------
+# Finished tasks move from TASKS into SQLite so memory only holds active downloads.
+TASKS_DB_PATH = os.environ.get("TASKS_DB", "tasks.db")
+TASKS_DB = {"conn": None, "since_prune": 0}
+TASKS_DB_LOCK = threading.Lock()
+# Archived rows are kept for TASKS_TTL seconds and at most TASKS_DB_MAX rows,
+# checked every TASKS_PRUNE_EVERY archives
+TASKS_TTL = int(os.environ.get("TASKS_TTL", str(7 * 24 * 3600)))
+TASKS_DB_MAX = int(os.environ.get("TASKS_DB_MAX", "10000"))
+TASKS_PRUNE_EVERY = 100
+
+
+def tasks_db():
+    # opened on first use (after any gunicorn fork); callers hold TASKS_DB_LOCK
+    if TASKS_DB["conn"] is None:
+        conn = sqlite3.connect(TASKS_DB_PATH, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS tasks ("
+                     "task_id TEXT PRIMARY KEY, status TEXT, filename TEXT, task_json TEXT, finished REAL)")
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(tasks)")}
+        if "finished" not in columns:
+            # archives created before pruning existed; old rows go on the next prune
+            conn.execute("ALTER TABLE tasks ADD COLUMN finished REAL DEFAULT 0")
+        conn.execute("CREATE INDEX IF NOT EXISTS tasks_finished ON tasks (finished)")
+        TASKS_DB["conn"] = conn
+    return TASKS_DB["conn"]
+
+
+def archive_task(task_id):
+    t = TASKS.get(task_id)
+    if t is None or t.status not in ("done", "error"):
+        return
+    try:
+        with TASKS_DB_LOCK:
+            conn = tasks_db()
+            conn.execute("INSERT OR REPLACE INTO tasks (task_id, status, filename, task_json, finished) "
+                         "VALUES (?, ?, ?, ?, ?)",
+                         (task_id, t.status, t.filename, json.dumps(t.to_dict()), time.time()))
+            TASKS_DB["since_prune"] += 1
+            if TASKS_DB["since_prune"] >= TASKS_PRUNE_EVERY:
+                TASKS_DB["since_prune"] = 0
+                prune_archive(conn)
+            conn.commit()
+    except Exception:
+        app.logger.exception("Could not archive task %s; keeping it in memory", task_id)
+        return
+    with TASK_LOCK:
+        if TASKS.pop(task_id, None) is not None:
+            _release_task(t)
+
+
+def prune_archive(conn):
+    # callers hold TASKS_DB_LOCK
+    conn.execute("DELETE FROM tasks WHERE finished < ?", (time.time() - TASKS_TTL,))
+    conn.execute("DELETE FROM tasks WHERE task_id IN (SELECT task_id FROM tasks "
+                 "ORDER BY finished DESC LIMIT -1 OFFSET ?)", (TASKS_DB_MAX,))
+
+
+def load_archived_task(task_id):
+    try:
+        with TASKS_DB_LOCK:
+            row = tasks_db().execute("SELECT task_json FROM tasks WHERE task_id = ?", (task_id,)).fetchone()
+    except Exception:
+        app.logger.exception("Could not read archived task %s", task_id)
+        return None
+    return json_loads(row[0]) if row else None
+
+# ---------------- Stall monitor ----------------
+# One watchdog thread sleeps until the earliest (deadline, task_id) in STALL_HEAP.
+# When an entry fires the task's real deadline is recomputed from its latest
+# progress; if it moved the entry is re-armed, so progress updates cost nothing here.
+STALL_HEAP: list[tuple[float, str]] = []
+STALL_COND = threading.Condition()
+
+
+def _stall_timeout(status):
+    if status == "processing":
+        return 900  # 15 minutes for processing; increase if large files often
+    if status == "running":
+        return 180
+    return None  # queued tasks are waiting for a pool slot, not for the network
+
+
+def stall_deadline(t):
+    timeout = _stall_timeout(t.status)
+    if timeout is None:
+        return None
+    return (t.last_progress_time or t.created) + timeout
+
+
+def check_stall(task_id, t):
+    """Mark the task stalled if its deadline passed; otherwise return the deadline to re-arm (or None)."""
+    status = t.status
+    timeout = _stall_timeout(status)
+    if timeout is None:
+        return None
+    deadline = (t.last_progress_time or t.created) + timeout
+    if deadline > time.time():
+        return deadline
+    t.status = "error"
+    t.error = "stalled_download_timeout"
+    add_task_message(task_id, f"Stalled: no progress detected for {int(timeout)} seconds (status={status})")
+    return None
+
+
+def stall_monitor():
+    with STALL_COND:
+        while True:
+            if not STALL_HEAP:
+                STALL_COND.wait()
+                continue
+            delay = STALL_HEAP[0][0] - time.time()
+            if delay > 0:
+                STALL_COND.wait(delay)
+                continue
+            _, tid = heapq.heappop(STALL_HEAP)
+            t = TASKS.get(tid)
+            if t is None:
+                continue
+            try:
+                deadline = check_stall(tid, t)
+            except Exception:
+                app.logger.exception("stall monitor error")
+                continue
+            if deadline is not None:
+                heapq.heappush(STALL_HEAP, (deadline, tid))
+
+
+def watch_stall(task_id):
+    """Start stall tracking for a task that has just started running."""
+    t = TASKS.get(task_id)
+    deadline = stall_deadline(t) if t is not None else None
+    if deadline is None:
+        return
+    start_stall_monitor()
+    with STALL_COND:
+        heapq.heappush(STALL_HEAP, (deadline, task_id))
+        STALL_COND.notify()
+
+
+def start_stall_monitor():
+    # started lazily so a preloading server doesn't fork away the thread
+    with TASK_LOCK:
+        if STALL_MONITOR["thread"] is None:
+            th = threading.Thread(target=stall_monitor, name="stall-monitor", daemon=True)
+            th.start()
+            STALL_MONITOR["thread"] = th
+
 # ---------------- Routes ----------------
 @app.route("/", methods=["GET"])
 def index():
@@ -569,50 +1560,24 @@ def favicon():
 def info_route():
     url = get_request_param("url")
     if not url:
-        return jsonify({"ok": False, "error": "url parameter missing"}), 400
-
-    cookiefile_path = None
-    created_env_cookie = None
-    if "cookies" in request.files:
-        f = request.files["cookies"]
-        tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".txt")
-        f.save(tmp.name)
-        cookiefile_path = tmp.name
+        return ojson({"ok": False, "error": "url parameter missing"}, 400)
 
     try_browser = str(get_request_param("try_browser_cookies", "0")).lower() in ("1", "true", "yes")
 
+    cookie_cleanup = contextlib.ExitStack()
     try:
-        # If no uploaded cookiefile, try to create one from env for this request
-        if not cookiefile_path:
-            env_path = make_cookiefile_from_env()
-            if env_path:
-                cookiefile_path = env_path
-                created_env_cookie = env_path
-
+        cookiefile_path = _with_uploaded_cookies(cookie_cleanup)
         result = yt_extract_info(url, cookiefile=cookiefile_path, try_browser_cookies=try_browser)
     except Exception as e:
         tb = traceback.format_exc()
         app.logger.exception("Exception in info_route")
-        if cookiefile_path and created_env_cookie:
-            try: os.unlink(cookiefile_path)
-            except: pass
-        return jsonify({"ok": False, "error": "internal_error", "detail": str(e), "trace": tb}), 500
-
-    # cleanup any cookiefile created by uploaded file or env
-    if cookiefile_path and created_env_cookie:
-        try:
-            os.unlink(cookiefile_path)
-        except Exception:
-            pass
-    elif cookiefile_path and "cookies" in request.files:
-        try:
-            os.unlink(cookiefile_path)
-        except Exception:
-            pass
+        return ojson({"ok": False, "error": "internal_error", "detail": str(e), "trace": tb}, 500)
+    finally:
+        cookie_cleanup.close()
 
     if "info" in result:
         info = result["info"]
-        return jsonify({
+        return ojson({
             "ok": True,
             "id": info.get("id"),
             "title": info.get("title"),
@@ -621,138 +1586,175 @@ def info_route():
             "is_live": info.get("is_live"),
             "webpage_url": info.get("webpage_url") or url,
             "thumbnail": info.get("thumbnail"),
-            "formats": info.get("formats") or [],
-            "attempts": result.get("attempts", []),
-        }), 200
+            "formats": formats_columns(info.get("formats") or []),
+            "attempts": attempts_summary(result),
+        })
     else:
-        return jsonify({"ok": False, "error": result.get("error", "unknown"), "attempts": result.get("attempts", [])}), 422
+        return ojson({"ok": False, "error": result.get("error", "unknown"), "attempts": attempts_summary(result)}, 422)
 
 @app.route("/download", methods=["POST"])
 def download_route():
     url = get_request_param("url")
     if not url:
-        return jsonify({"ok": False, "error": "url parameter missing"}), 400
+        return ojson({"ok": False, "error": "url parameter missing"}, 400)
 
     requested = get_request_param("requested")
-    cookiefile_path = None
-    created_env_cookie = None
-    if "cookies" in request.files:
-        f = request.files["cookies"]
-        tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".txt")
-        f.save(tmp.name)
-        cookiefile_path = tmp.name
-
     try_browser = str(get_request_param("try_browser_cookies", "0")).lower() in ("1", "true", "yes")
+    # target codec when the download has to be re-encoded for QuickTime; hevc is tagged hvc1
+    video_codec = str(get_request_param("video_codec", "h264")).lower()
+    if video_codec not in ("h264", "hevc"):
+        return ojson({"ok": False, "error": "video_codec must be h264 or hevc"}, 400)
 
-    try:
-        # If no uploaded cookiefile, try to create one from env for this request
-        if not cookiefile_path:
-            env_path = make_cookiefile_from_env()
-            if env_path:
-                cookiefile_path = env_path
-                created_env_cookie = env_path
+    # held until the worker finishes; checked before the (slow) info prefetch
+    if not DOWNLOAD_SLOTS.acquire(blocking=False):
+        return ojson({"ok": False, "error": "busy", "detail": "too many downloads in progress; retry later"}, 503)
 
+    # ownership of the temp cookiefile passes to the worker, which closes this stack when done
+    cookie_cleanup = contextlib.ExitStack()
+    try:
+        cookiefile_path = _with_uploaded_cookies(cookie_cleanup)
         info_result = yt_extract_info(url, cookiefile=cookiefile_path, try_browser_cookies=try_browser)
     except Exception as e:
+        cookie_cleanup.close()
+        DOWNLOAD_SLOTS.release()
         app.logger.exception("Failed to prefetch info for download")
-        if cookiefile_path and created_env_cookie:
-            try: os.unlink(cookiefile_path)
-            except: pass
-        return jsonify({"ok": False, "error": "prefetch_failed", "detail": str(e)}), 500
+        return ojson({"ok": False, "error": "prefetch_failed", "detail": str(e)}, 500)
 
-    fmt_to_use = None
-    audio_convert = None
+    task_id = str(uuid.uuid4())
 
-    if "info" in info_result:
-        info = info_result["info"]
-        formats = info.get("formats") or []
-        if requested and requested.startswith("audio:"):
-            codec = requested.split(":", 1)[1]
-            fmt_to_use = "bestaudio"
-            audio_convert = {"codec": codec, "quality": 192}
-        elif requested:
-            sel = None
-            for f in formats:
-                if str(f.get("format_id")) == str(requested):
-                    sel = f
-                    break
-            if sel:
-                vcodec = sel.get("vcodec")
-                acodec = sel.get("acodec")
-                if vcodec and vcodec != "none" and (not acodec or acodec == "none"):
-                    fmt_to_use = f"{requested}+bestaudio/best"
-                else:
-                    fmt_to_use = requested
-            else:
-                fmt_to_use = None
-    else:
-        fmt_to_use = None
-        info = None
+    def abandon(e):
+        # the worker never got the job: give back the slot and the uploaded cookiefile
+        cookie_cleanup.close()
+        DOWNLOAD_SLOTS.release()
+        t = TASKS.get(task_id)
+        if t is not None:
+            t.status = "error"
+            t.error = str(e)
+        app.logger.exception("Failed to queue download")
+        return ojson({"ok": False, "error": "internal_error", "detail": str(e)}, 500)
 
-    task_id = str(uuid.uuid4())
-    with TASK_LOCK:
-        TASKS[task_id] = {"status": "queued", "progress": "0%", "url": url, "created": time.time(), "messages": []}
+    fmt_to_use = None
+    audio_convert = None
+    info = info_result.get("info")
+    try:
+        # JSON bodies may carry a bare format id number
+        requested = str(requested) if requested is not None else None
+        if info is not None:
+            formats = info.get("formats") or []
+            if requested and requested.startswith("audio:"):
+                codec = requested.split(":", 1)[1]
+                fmt_to_use = "bestaudio"
+                audio_convert = {"codec": codec, "quality": 192}
+            elif requested:
+                by_id = {str(f.get("format_id")): f for f in formats}
+                sel = by_id.get(requested)
+                if sel:
+                    vcodec = sel.get("vcodec")
+                    acodec = sel.get("acodec")
+                    if vcodec and vcodec != "none" and (not acodec or acodec == "none"):
+                        fmt_to_use = f"{requested}+bestaudio/best"
+                    else:
+                        fmt_to_use = requested
+
+        add_task(task_id, new_task(url))
+        if info is not None and not fmt_to_use:
+            TASKS[task_id].chosen_format = choose_format(info)
+
+        add_task_message(task_id, "Queued download task")
+    except Exception as e:
+        return abandon(e)
 
-    add_task_message(task_id, "Queued download task")
+    last_hook = {"ts": 0.0}
 
     def progress_hook(d):
         try:
             tid = task_id
+            t = TASKS[tid]
             if d.get("status") == "downloading":
                 total = d.get("total_bytes") or d.get("total_bytes_estimate")
-                downloaded = d.get("downloaded_bytes", 0)
+                downloaded = int(d.get("downloaded_bytes") or 0)
                 if total and total > 0:
-                    p = int(downloaded * 100 / total)
-                    TASKS[tid]["progress"] = f"{p}%"
+                    pct = downloaded * 100 // total
                 else:
-                    TASKS[tid]["progress"] = f"{min(int(downloaded/1024), 99)}%"
-                TASKS[tid]["speed"] = d.get("speed")
-                TASKS[tid]["last_progress_time"] = time.time()
-                add_task_message(tid, f"Downloading... {TASKS[tid]['progress']}")
+                    pct = min(downloaded >> 10, 99)
+                now = time.time()
+                # yt-dlp calls this for every chunk; publish only when the percentage moves or every 0.5s
+                if pct == t.progress_pct and now - last_hook["ts"] < 0.5:
+                    return
+                last_hook["ts"] = now
+                t.progress_pct = int(pct)
+                t.downloaded_bytes = downloaded
+                t.total_bytes = int(total) if total else None
+                t.speed = d.get("speed")
+                t.last_progress_time = now
             elif d.get("status") == "finished":
-                TASKS[task_id]["progress"] = "100%"
-                TASKS[task_id]["status"] = "processing"
-                TASKS[task_id]["last_progress_time"] = time.time()
-                add_task_message(task_id, "Download finished; processing/merging started")
+                t.progress_pct = 100
+                t.status = "processing"
+                t.last_progress_time = time.time()
+                add_task_message(tid, "Download finished; processing/merging started")
         except Exception:
             app.logger.exception("progress_hook error")
 
-    def worker(tid, u, cookiefile, try_browser_flag, fmt_str, audio_conv, pre_info):
-        TASKS[tid]["status"] = "running"
-        TASKS[tid]["last_progress_time"] = time.time()
+    def worker(tid, u, cookiefile, try_browser_flag, fmt_str, audio_conv, pre_info, vcodec):
+        with DOWNLOAD_QUEUE_LOCK:
+            DOWNLOAD_QUEUE["started"] = max(DOWNLOAD_QUEUE["started"], TASKS[tid].queue_seq)
+        TASKS[tid].status = "running"
+        TASKS[tid].last_progress_time = time.time()
+        watch_stall(tid)
         add_task_message(tid, "Task started")
 
-        out_template = str(DOWNLOAD_DIR / ("%(title)s - %(id)s.%(ext)s"))
 
-        def attempt_download(format_override, audio_convert_over):
+        def attempt_download(format_override, audio_convert_over, cookiefile_over=None, prefetched=None):
             add_task_message(tid, f"Attempting download (format={format_override or 'auto'})")
-            opts = prepare_yt_dlp_opts(cookiefile=cookiefile, output_template=out_template,
+            # YoutubeDL rewrites its cookiefile on close, and the env/browser ones are shared
+            # with concurrent requests; it gets a copy, removed when the task finishes
+            cookie_copy = _copy_cookiefile(cookiefile_over or cookiefile)
+            if cookie_copy:
+                cookie_cleanup.callback(_unlink_quiet, cookie_copy)
+            opts = prepare_yt_dlp_opts(cookiefile=cookie_copy, output_template=OUT_TEMPLATE,
                                        progress_hook=progress_hook, format_override=format_override,
                                        audio_convert=audio_convert_over)
             if format_override:
                 opts["format"] = format_override
             with yt_dlp.YoutubeDL(opts) as ydl:
-                infox = ydl.extract_info(u, download=True)
+                if prefetched is not None:
+                    # same path as --load-info-json: reselect and download without re-extracting
+                    infox = ydl.process_ie_result(ydl.sanitize_info(prefetched, True), download=True)
+                else:
+                    infox = ydl.extract_info(u, download=True)
                 add_task_message(tid, "yt-dlp: download & postprocessing finished")
-                real_path = find_file_by_info(infox)
+                real_path = find_file_by_info(infox, ydl)
                 if real_path is None:
                     fn = safe_basename(ydl.prepare_filename(infox))
                     real_path = DOWNLOAD_DIR / fn
                 add_task_message(tid, f"Raw saved file: {real_path.name}")
 
-                chosen_ext = choose_best_container(infox)
-                add_task_message(tid, f"Chosen container for compatibility: .{chosen_ext}")
-
-                final_path = remux_or_encode(tid, real_path, chosen_ext)
-                TASKS[tid].update({
-                    "status": "done", "progress": "100%", "filename": final_path.name,
-                    "info": {"title": infox.get("title"), "id": infox.get("id")},
-                    "last_progress_time": time.time()
-                })
+                # yt-dlp already knows the codecs it merged; only probe when it can't tell us.
+                # FFmpegExtractAudio rewrites info["ext"] but not acodec, so after an audio
+                # conversion only the file itself describes the output.
+                codec_info = None if audio_convert_over else infox
+                codecs = codecs_from_info(codec_info, real_path) or ffprobe_codecs(real_path)
+                if codecs and is_quicktime_compatible(codecs):
+                    add_task_message(tid, "Output already QuickTime-compatible; skipping remux/re-encode.")
+                    final_path = real_path
+                else:
+                    chosen_ext = choose_best_container(codec_info or {"vcodec": (codecs or {}).get("video"),
+                                                                      "acodec": (codecs or {}).get("audio")})
+                    add_task_message(tid, f"Chosen container for compatibility: .{chosen_ext}")
+                    final_path = remux_or_encode(tid, real_path, chosen_ext, info=codec_info, codecs=codecs,
+                                                 video_codec=vcodec)
+                t = TASKS[tid]
+                t.status = "done"
+                t.progress_pct = 100
+                t.filename = final_path.name
+                t.info = {"title": infox.get("title"), "id": infox.get("id")}
+                t.last_progress_time = time.time()
+                index_file(final_path, infox)
                 add_task_message(tid, f"Final file ready: {final_path.name}")
                 return True
 
         try:
+            chosen = TASKS[tid].chosen_format
             if fmt_str:
                 try:
                     add_task_message(tid, f"Trying requested format: {fmt_str}")
@@ -760,40 +1762,50 @@ def download_route():
                     return
                 except Exception as e_fmt:
                     app.logger.info("Requested format failed: %s", e_fmt)
-                    TASKS[tid]["last_error"] = str(e_fmt)
+                    TASKS[tid].last_error = str(e_fmt)
                     add_task_message(tid, f"Requested format failed: {str(e_fmt)}")
+            elif chosen:
+                try:
+                    add_task_message(tid, f"Using format picked from prefetched info: {chosen}")
+                    attempt_download(chosen, audio_conv, prefetched=pre_info)
+                    return
+                except Exception as e_chosen:
+                    app.logger.info("Prefetched format failed: %s", e_chosen)
+                    TASKS[tid].last_error = str(e_chosen)
+                    add_task_message(tid, f"Prefetched format failed: {str(e_chosen)}")
+                try:
+                    # the prefetched URLs may have expired while queued; extract again, with
+                    # the default selector in the same pass in case the ids changed
+                    add_task_message(tid, f"Retrying {chosen} with fresh info")
+                    attempt_download(f"{chosen}/bestvideo*+bestaudio/best", audio_conv)
+                    return
+                except Exception as e_fresh:
+                    app.logger.info("Fresh retry of prefetched format failed: %s", e_fresh)
+                    TASKS[tid].last_error = str(e_fresh)
+                    add_task_message(tid, f"Fresh retry failed: {str(e_fresh)}")
 
-            if try_browser_flag and BROWSER_COOKIE3_AVAILABLE:
-                tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".txt")
-                tmp.close()
-                ok = False
+            browser_path = browser_cookiefile("youtube.com") if try_browser_flag else None
+            if browser_path:
                 try:
-                    ok = export_browser_cookies_for_domain("youtube.com", tmp.name)
-                except Exception:
-                    ok = False
-                if ok:
-                    try:
-                        add_task_message(tid, "Trying with local browser cookies")
-                        # prefer browser cookiefile for this attempt
-                        attempt_download(None, audio_conv)
-                        try: os.unlink(tmp.name)
-                        except: pass
-                        return
-                    except Exception as e2:
-                        app.logger.info("browser-cookie retry failed: %s", e2)
-                        TASKS[tid]["last_error"] = str(e2)
-                        add_task_message(tid, f"Browser-cookie retry failed: {str(e2)}")
-                        try: os.unlink(tmp.name)
-                        except: pass
+                    add_task_message(tid, "Trying with local browser cookies")
+                    # prefer browser cookiefile for this attempt
+                    attempt_download(None, audio_conv, cookiefile_over=browser_path)
+                    return
+                except Exception as e2:
+                    app.logger.info("browser-cookie retry failed: %s", e2)
+                    TASKS[tid].last_error = str(e2)
+                    add_task_message(tid, f"Browser-cookie retry failed: {str(e2)}")
 
-            try:
-                add_task_message(tid, "Trying default best merge (video+audio)")
-                attempt_download(None, audio_conv)
-                return
-            except Exception as e_best:
-                app.logger.info("Default best attempt failed: %s", e_best)
-                TASKS[tid]["last_error"] = str(e_best)
-                add_task_message(tid, f"Default attempt failed: {str(e_best)}")
+            # the fresh retry of the chosen format already fell back to the default selector
+            if not chosen:
+                try:
+                    add_task_message(tid, "Trying default best merge (video+audio)")
+                    attempt_download(None, audio_conv)
+                    return
+                except Exception as e_best:
+                    app.logger.info("Default best attempt failed: %s", e_best)
+                    TASKS[tid].last_error = str(e_best)
+                    add_task_message(tid, f"Default attempt failed: {str(e_best)}")
 
             try:
                 add_task_message(tid, "Trying fallback 'best' single-file")
@@ -801,95 +1813,102 @@ def download_route():
                 return
             except Exception as e_last:
                 app.logger.exception("Final fallback failed: %s", e_last)
-                TASKS[tid].update({"status": "error", "error": str(e_last)})
+                TASKS[tid].status = "error"
+                TASKS[tid].error = str(e_last)
                 add_task_message(tid, f"Final fallback failed: {str(e_last)}")
                 return
 
         except Exception as e:
             app.logger.exception("Download worker exception: %s", e)
-            TASKS[tid].update({"status": "error", "error": str(e)})
+            TASKS[tid].status = "error"
+            TASKS[tid].error = str(e)
             add_task_message(tid, f"Worker exception: {str(e)}")
         finally:
-            # cleanup cookiefile if it was created from env (we marked created_env_cookie earlier)
-            if cookiefile:
-                try:
-                    if str(cookiefile).startswith(tempfile.gettempdir()):
-                        os.unlink(cookiefile)
-                except Exception:
-                    pass
-
-    th = threading.Thread(target=worker, args=(task_id, url, cookiefile_path, try_browser, fmt_to_use, audio_convert, info), daemon=True)
-    th.start()
+            cookie_cleanup.close()
+            archive_task(tid)
+            DOWNLOAD_SLOTS.release()
 
-    # Monitor thread
-    def monitor():
-        while True:
-            t = TASKS.get(task_id)
-            if not t:
-                return
-            status = t.get("status")
-            if status in ("done", "error"):
-                return
-            last = t.get("last_progress_time", t.get("created", time.time()))
-            default_timeout = 180
-            if status == "processing":
-                timeout = 900  # 15 minutes for processing; increase if large files often
-            else:
-                timeout = default_timeout
-            if time.time() - last > timeout:
-                TASKS[task_id].update({"status": "error", "error": "stalled_download_timeout"})
-                add_task_message(task_id, f"Stalled: no progress detected for {int(timeout)} seconds (status={status})")
-                return
-            time.sleep(5)
-    mth = threading.Thread(target=monitor, daemon=True)
-    mth.start()
+    try:
+        TASKS[task_id].queue_seq = next(DOWNLOAD_QUEUE["seq"])
+        DOWNLOAD_POOL.submit(worker, task_id, url, cookiefile_path, try_browser, fmt_to_use, audio_convert, info,
+                             video_codec)
+    except Exception as e:
+        return abandon(e)
 
-    return jsonify({"ok": True, "task_id": task_id}), 200
+    return ojson({"ok": True, "task_id": task_id})
 
 @app.route("/task/<task_id>", methods=["GET"])
 def task_status(task_id):
     t = TASKS.get(task_id)
-    if not t:
-        return jsonify({"ok": False, "error": "unknown task id"}), 404
-    msgs = t.get("messages", [])[-300:]
-    resp = {k: v for k, v in t.items() if k != "messages"}
-    resp["messages"] = msgs
-    return jsonify({"ok": True, "task": resp}), 200
+    if t is not None:
+        return ojson({"ok": True, "task": t.to_dict()})
+    archived = load_archived_task(task_id)
+    if archived is None:
+        return ojson({"ok": False, "error": "unknown task id"}, 404)
+    return ojson({"ok": True, "task": archived})
+
+# Behind nginx, set DOWNLOADS_ACCEL_PREFIX (e.g. "/internal-downloads/") and nginx
+# sends the file itself with sendfile(2), never passing the bytes through Python:
+#   location /internal-downloads/ { internal; alias /path/to/downloads/; sendfile on; tcp_nopush on; }
+DOWNLOADS_ACCEL_PREFIX = os.environ.get("DOWNLOADS_ACCEL_PREFIX")
+
+
+def send_download(path: Path):
+    if DOWNLOADS_ACCEL_PREFIX:
+        resp = app.response_class(mimetype=mimetypes.guess_type(path.name)[0] or "application/octet-stream")
+        resp.headers["X-Accel-Redirect"] = DOWNLOADS_ACCEL_PREFIX.rstrip("/") + "/" + urllib.parse.quote(path.name)
+        if path.name.isascii():
+            resp.headers.set("Content-Disposition", "attachment", filename=path.name)
+        else:
+            # same RFC 6266 fallback Flask's send_file uses for non-ASCII names
+            simple = unicodedata.normalize("NFKD", path.name).encode("ascii", "ignore").decode("ascii")
+            resp.headers.set("Content-Disposition", "attachment", filename=simple,
+                             **{"filename*": "UTF-8''" + urllib.parse.quote(path.name, safe="!#$&+^`|~")})
+        return resp
+    # conditional/etag let browsers revalidate instead of re-fetching, and serving from a
+    # directory lets the WSGI server use its file wrapper (sendfile under gunicorn)
+    return send_from_directory(str(DOWNLOAD_DIR), path.name, as_attachment=True,
+                               conditional=True, etag=True, max_age=3600)
 
 @app.route("/download_file/<filename>", methods=["GET"])
 def serve_file(filename):
     safe_name = Path(filename).name
     safe_path = DOWNLOAD_DIR / safe_name
     if safe_path.exists():
-        return send_file(str(safe_path), as_attachment=True)
+        return send_download(safe_path)
 
     try:
         decoded = html.unescape(safe_name)
     except Exception:
         decoded = safe_name
 
-    for tid, t in TASKS.items():
-        fn = t.get("filename")
-        info = t.get("info") or {}
+    indexed = lookup_indexed_file(decoded)
+    if indexed is not None:
+        return send_download(indexed)
+
+    files = scan_download_dir()
+    for tid, t in list(TASKS.items()):
+        fn = t.filename
+        info = t.info or {}
         vid = info.get("id") if info else None
         if fn and (fn == decoded or decoded in fn):
             candidate = DOWNLOAD_DIR / fn
             if candidate.exists():
-                return send_file(str(candidate), as_attachment=True)
+                return send_download(candidate)
         if vid and vid in decoded:
-            for p in DOWNLOAD_DIR.iterdir():
-                if p.is_file() and vid in p.name:
-                    return send_file(str(p), as_attachment=True)
+            for e in files:
+                if vid in e.name:
+                    return send_download(Path(e.path))
 
     stem = Path(decoded).stem
-    for p in DOWNLOAD_DIR.iterdir():
-        if p.is_file() and Path(p.name).stem == stem:
-            return send_file(str(p), as_attachment=True)
+    entry = find_by_stem(stem)
+    if entry is not None:
+        return send_download(Path(entry.path))
 
-    target = stem.lower().replace(" ", "")
-    for p in DOWNLOAD_DIR.iterdir():
-        if p.is_file() and target and target in p.name.lower().replace(" ", ""):
-            return send_file(str(p), as_attachment=True)
+    target = _slug(stem)
+    entry = find_by_slug(target) if target else None
+    if entry is not None:
+        return send_download(Path(entry.path))
 
     return jsonify({"ok": False, "error": "file not found", "filename_checked": str(safe_path)}), 404
 
@@ -904,35 +1923,62 @@ def server_error(e):
     return jsonify({"ok": False, "error": "internal_server_error", "detail": str(e), "trace": tb}), 500
 
 # Port helpers
-def is_port_free(port, host="0.0.0.0"):
+def is_port_free(port, host="127.0.0.1"):
+    # nothing accepting a connection means free; no bind/close cycle per probe
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        try:
-            s.bind((host, port))
-            return True
-        except OSError:
-            return False
+        s.settimeout(0.05)
+        return s.connect_ex((host, port)) != 0
 
 
 def pick_port(preferred=None, fallback_range=range(5001, 5011)):
+    candidates = []
     if preferred:
         try:
-            p = int(preferred)
-            if is_port_free(p):
-                return p
+            candidates.append(int(preferred))
         except Exception:
             pass
-    for p in fallback_range:
-        if is_port_free(p):
-            return p
+    candidates += [p for p in fallback_range if p not in candidates]
+    if candidates:
+        # probe every candidate at once, then take the first free one in preference order
+        with ThreadPoolExecutor(max_workers=len(candidates)) as ex:
+            for p, free in zip(candidates, ex.map(is_port_free, candidates)):
+                if free:
+                    return p
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
         s.bind(("", 0))
         return s.getsockname()[1]
 
+# Production runs under gunicorn (see Procfile): one process, since TASKS and the
+# download pool live in memory, with gthread workers for concurrent /task polling.
+# --preload is safe because the background threads are started lazily.
+def run_gunicorn(bind):
+    """
+    Serve app with gunicorn from this process, using the Procfile settings. The module
+    is already imported, so this is --preload without importing it a second time, and
+    the working directory (downloads/, tasks.db) stays the caller's.
+    """
+    from gunicorn.app.base import BaseApplication
+
+    class _Server(BaseApplication):
+        def load_config(self):
+            for key, value in {"bind": bind, "workers": 1, "worker_class": "gthread",
+                               "threads": 32, "preload_app": True}.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return app
+
+    _Server().run()
+
+
 if __name__ == "__main__":
     env_port = os.environ.get("PORT")
     preferred = int(env_port) if env_port and env_port.isdigit() else 5000
     port_to_use = pick_port(preferred=preferred, fallback_range=range(preferred+1, preferred+11))
     host = "0.0.0.0"
     print(f"Starting Flask app on http://127.0.0.1:{port_to_use}  (host {host})")
-    app.run(host=host, port=port_to_use, debug=False)
+    print(f"H.264 re-encodes use {H264_ENCODER}")
+    if GUNICORN_AVAILABLE and os.environ.get("FLASK_ENV") != "development":
+        run_gunicorn(f"{host}:{port_to_use}")
+    else:
+        app.run(host=host, port=port_to_use, debug=False)
@@ -4,32 +4,38 @@
 # Works with: Chrome, Edge, Firefox (auto detects installed)
 # ==========================================================
 
+import io
+from concurrent.futures import ThreadPoolExecutor
+
 import browser_cookie3
 
 def try_browser(browser_name, loader):
-    """Helper to test each browser cookie loader"""
+    """Helper to test each browser cookie loader; returns the report text"""
+    out = io.StringIO()  # buffered so parallel runs don't interleave their output
     try:
         cj = loader()
         cookies = list(cj)
-        print(f"\n🌐 {browser_name}: Found {len(cookies)} cookies ✅")
+        print(f"\n🌐 {browser_name}: Found {len(cookies)} cookies ✅", file=out)
         for c in cookies[:5]:  # show first 5 cookies
-            print(f"  {c.domain}\t{c.name}\t{(c.value[:30] + '...') if len(c.value) > 30 else c.value}")
+            print(f"  {c.domain}\t{c.name}\t{(c.value[:30] + '...') if len(c.value) > 30 else c.value}", file=out)
     except Exception as e:
-        print(f"\n⚠️  {browser_name}: Error while reading cookies ❌")
-        print("   ", e)
+        print(f"\n⚠️  {browser_name}: Error while reading cookies ❌", file=out)
+        print("   ", e, file=out)
+    return out.getvalue()
 
 
 def main():
     print("🍪 Browser Cookie Test — started\n")
 
-    # Try Chrome
-    try_browser("Google Chrome", browser_cookie3.chrome)
-
-    # Try Edge
-    try_browser("Microsoft Edge", browser_cookie3.edge)
-
-    # Try Firefox
-    try_browser("Mozilla Firefox", browser_cookie3.firefox)
+    browsers = [
+        ("Google Chrome", browser_cookie3.chrome),
+        ("Microsoft Edge", browser_cookie3.edge),
+        ("Mozilla Firefox", browser_cookie3.firefox),
+    ]
+    # each browser's cookie store is read independently, so read them all at once
+    with ThreadPoolExecutor(max_workers=len(browsers)) as ex:
+        for report in ex.map(lambda b: try_browser(*b), browsers):
+            print(report, end="")
 
     print("\n✅ Test completed.")
     print("If at least one browser shows cookies found, auto-cookie feature will work.\n")
@@ -64,14 +64,16 @@ function appendLog(msg) {
   liveLog.scrollTop = liveLog.scrollHeight;
 }
 
-function showHintForStatus(status) {
+function showHintForStatus(status, queuedAhead) {
   if (!status) { hintArea.classList.add("hidden"); return; }
   const lower = (status || "").toLowerCase();
   if (lower === "running" || lower === "processing") {
     hintText.innerText = "Background task running — merging/encoding may take time. Copy/remux is used where possible for speed.";
     hintArea.classList.remove("hidden");
   } else if (lower === "queued") {
-    hintText.innerText = "Task queued — will start shortly.";
+    hintText.innerText = queuedAhead
+      ? `Task queued — waiting for ${queuedAhead} download${queuedAhead === 1 ? "" : "s"} ahead of it.`
+      : "Task queued — will start shortly.";
     hintArea.classList.remove("hidden");
   } else {
     hintArea.classList.add("hidden");
@@ -107,7 +109,14 @@ getInfoBtn.addEventListener("click", async () => {
     metaRow.innerText = meta;
 
     formatSelect.innerHTML = "";
-    const fmts = data.formats || [];
+    // formats arrive column-oriented ({key: [value per format]}); rebuild rows
+    const cols = data.formats || {};
+    const keys = Object.keys(cols);
+    const fmts = (cols.format_id || []).map((_, i) => {
+      const row = {};
+      for (const k of keys) row[k] = cols[k][i];
+      return row;
+    });
 
     const candidates = [];
     for (const f of fmts) {
@@ -190,27 +199,37 @@ downloadBtn.addEventListener("click", async () => {
     appendLog(`Task started: ${task_id}`);
     statusText.innerText = "Download started: " + task_id;
 
-    const poll = setInterval(async () => {
+    // Poll quickly while the task is changing and back off while it is idle
+    // (queued, long encodes), resetting as soon as anything moves.
+    const POLL_MIN = 1000, POLL_MAX = 10000;
+    let pollDelay = POLL_MIN;
+    let lastSeen = "";
+    const poll = async () => {
+      let finished = false;
       try {
         const r = await fetch(`/task/${task_id}`);
         const j = await r.json();
         if (!j.ok) { console.error("task error", j); return; }
         const task = j.task || {};
         const st = task.status || "";
+        const msgs = task.messages || [];
+        // the log is capped server-side, so its length stops changing; key on the newest line
+        const [lastTs, lastText] = msgs.length ? msgs[msgs.length - 1] : [];
+        const seen = `${st}|${task.progress}|${lastTs}|${lastText}|${task.queued_ahead}`;
+        pollDelay = seen === lastSeen ? Math.min(pollDelay * 1.5, POLL_MAX) : POLL_MIN;
+        lastSeen = seen;
 
         // update live log from task.messages
-        const msgs = task.messages || [];
         liveLog.innerHTML = "";
-        msgs.forEach(m => {
-          const d = new Date(m.ts * 1000);
-          const ts = d.toLocaleTimeString();
+        msgs.forEach(([when, text]) => {
+          const ts = new Date(when * 1000).toLocaleTimeString();
           const el = document.createElement("div");
-          el.textContent = `[${ts}] ${m.text}`;
+          el.textContent = `[${ts}] ${text}`;
           liveLog.appendChild(el);
         });
         liveLog.scrollTop = liveLog.scrollHeight;
 
-        showHintForStatus(st);
+        showHintForStatus(st, task.queued_ahead);
 
         if (task.progress) {
           let p = task.progress;
@@ -222,7 +241,7 @@ downloadBtn.addEventListener("click", async () => {
         }
 
         if (st === "done" || task.filename) {
-          clearInterval(poll);
+          finished = true;
           progressInner.style.width = "100%";
           statusText.innerText = "✅ Download complete";
           resetButton(downloadBtn, "Download");
@@ -237,7 +256,7 @@ downloadBtn.addEventListener("click", async () => {
             alert("Download finished but filename unknown.");
           }
         } else if (st === "error" || task.error) {
-          clearInterval(poll);
+          finished = true;
           alert("❌ Download failed: " + (task.error || "unknown"));
           appendLog("Task error: " + (task.error || "unknown"));
           progressBar.classList.add("hidden");
@@ -247,8 +266,11 @@ downloadBtn.addEventListener("click", async () => {
         }
       } catch (err) {
         console.error("poll error", err);
+      } finally {
+        if (!finished) setTimeout(poll, pollDelay);
       }
-    }, 1500);
+    };
+    setTimeout(poll, POLL_MIN);
 
   } catch (err) {
     alert("Failed to start download: " + (err.message || err));
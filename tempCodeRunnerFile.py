@@ -1,8 +1,10 @@
 import os
+import queue
 import threading
 import uuid
 import warnings
-from urllib.parse import urlparse, parse_qs
+from contextlib import contextmanager
+from urllib.parse import urlparse, urlsplit
 from flask import Flask, render_template, request, jsonify, send_file
 import yt_dlp
 import browser_cookie3
@@ -15,35 +17,115 @@ COOKIE_FILE = os.path.join(DOWNLOAD_DIR, "cookies_auto.txt")
 
 progress_data = {}
 
+# Idle YoutubeDL instances per option set. Building one re-parses options and sets up
+# extractors, so get_info borrows a ready one; concurrent requests each get their own.
+# Pooled instances deliberately never write their cookie jar back to COOKIE_FILE (a
+# one-shot `with YoutubeDL(...)` would on exit): the file is the source of truth, and
+# rewriting it would bump its mtime and flush the pools on every request.
+_YDL_POOLS = {}
+_YDL_POOLS_LOCK = threading.Lock()
+# mtime of COOKIE_FILE the pooled instances were built with (None = no file)
+_COOKIE_STATE = {"mtime": None}
+
+
+def cookie_file_for_ydl():
+    """
+    COOKIE_FILE if it exists, else None. One stat per request; when the file changed
+    since the pooled instances loaded it, the pools are dropped so they re-read it,
+    otherwise they keep using the cookie jar they already parsed.
+    """
+    try:
+        mtime = os.stat(COOKIE_FILE).st_mtime_ns
+    except OSError:
+        mtime = None
+    stale = []
+    with _YDL_POOLS_LOCK:
+        if mtime != _COOKIE_STATE["mtime"]:
+            _COOKIE_STATE["mtime"] = mtime
+            stale = list(_YDL_POOLS.values())
+            _YDL_POOLS.clear()
+    for pool in stale:
+        while True:
+            try:
+                _close_ydl(pool.get_nowait())
+            except queue.Empty:
+                break
+    return COOKIE_FILE if mtime is not None else None
+
+
+def _close_ydl(ydl):
+    # close() saves the jar to the cookiefile first; a pooled jar may be older than the file
+    ydl.params["cookiefile"] = None
+    ydl.close()
+
+
+@contextmanager
+def borrowed_ydl(opts: dict):
+    key = tuple(sorted(opts.items()))
+    with _YDL_POOLS_LOCK:
+        pool = _YDL_POOLS.setdefault(key, queue.SimpleQueue())
+    try:
+        ydl = pool.get_nowait()
+    except queue.Empty:
+        ydl = yt_dlp.YoutubeDL(dict(opts))  # YoutubeDL adds keys to the dict it is given
+    try:
+        yield ydl
+    finally:
+        with _YDL_POOLS_LOCK:
+            # pools dropped by cookie_file_for_ydl() are gone; don't refill an orphan
+            pooled = _YDL_POOLS.get(key) is pool
+            if pooled:
+                pool.put(ydl)
+        if not pooled:
+            _close_ydl(ydl)
+
 # ---------- Smart URL Normalizer ----------
-def normalize_url(url: str) -> str:
-    """Return a clean standard URL for YouTube, Instagram, Threads, etc."""
-    parsed = urlparse(url)
-
-    # --- YouTube Normalization ---
-    if "youtu.be" in parsed.netloc:
-        vid = parsed.path.strip("/")
-        return f"https://www.youtube.com/watch?v={vid}"
-    if "youtube.com" in parsed.netloc:
-        qs = parse_qs(parsed.query)
-        if "v" in qs:
-            vid = qs["v"][0]
-            return f"https://www.youtube.com/watch?v={vid}"
-        if "/shorts/" in parsed.path:
-            vid = parsed.path.split("/shorts/")[1].split("/")[0]
-            return f"https://www.youtube.com/watch?v={vid}"
-        if "/embed/" in parsed.path:
-            vid = parsed.path.split("/embed/")[1].split("/")[0]
-            return f"https://www.youtube.com/watch?v={vid}"
-        return url
-
-    # --- Instagram / Threads / Facebook / LinkedIn / X ---
-    if any(p in parsed.netloc for p in ["instagram.com", "threads.net", "facebook.com", "linkedin.com", "x.com", "twitter.com", "fb.watch"]):
-        return url.split("?")[0]
+def _watch_url(vid: str) -> str:
+    return f"https://www.youtube.com/watch?v={vid}"
+
+
+def _norm_youtu_be(url, parts):
+    return _watch_url(parts.path.strip("/"))
 
+
+def _norm_youtube(url, parts):
+    # first "v=" parameter, without building parse_qs dicts
+    vid = ("&" + parts.query).partition("&v=")[2].partition("&")[0]
+    if vid:
+        return _watch_url(vid)
+    path = parts.path
+    for marker in ("/shorts/", "/embed/"):
+        if marker in path:
+            return _watch_url(path.partition(marker)[2].partition("/")[0])
     return url
 
 
+def _norm_strip_query(url, parts):
+    return url.partition("?")[0]
+
+
+# keyed on the last two labels of the host, so www./m./music. subdomains share an entry
+_NORMALIZERS = {
+    "youtu.be": _norm_youtu_be,
+    "youtube.com": _norm_youtube,
+    "instagram.com": _norm_strip_query,
+    "threads.net": _norm_strip_query,
+    "facebook.com": _norm_strip_query,
+    "linkedin.com": _norm_strip_query,
+    "x.com": _norm_strip_query,
+    "twitter.com": _norm_strip_query,
+    "fb.watch": _norm_strip_query,
+}
+
+
+def normalize_url(url: str) -> str:
+    """Return a clean standard URL for YouTube, Instagram, Threads, etc."""
+    parts = urlsplit(url)
+    host = (parts.hostname or "").split(".")
+    normalizer = _NORMALIZERS.get(".".join(host[-2:]))
+    return normalizer(url, parts) if normalizer else url
+
+
 # ---------- Auto Cookie Extraction ----------
 def try_auto_extract():
     try:
@@ -51,10 +133,12 @@ def try_auto_extract():
         cookies = list(cj)
         if not cookies:
             return False, "No cookies found. Try running browser or login first."
-        with open(COOKIE_FILE, "w", encoding="utf-8") as f:
-            f.write("# Netscape HTTP Cookie File\n")
-            for c in cookies:
-                f.write(f"{c.domain}\tTRUE\t{c.path}\t{str(c.secure).upper()}\t0\t{c.name}\t{c.value}\n")
+        lines = ["# Netscape HTTP Cookie File\n"]
+        lines.extend(f"{c.domain}\tTRUE\t{c.path}\t{str(c.secure).upper()}\t0\t{c.name}\t{c.value}\n"
+                     for c in cookies)
+        # encode once and hand the file a single buffer
+        with open(COOKIE_FILE, "wb") as f:
+            f.write("".join(lines).encode("utf-8"))
         return True, f"✅ {len(cookies)} cookies exported successfully."
     except PermissionError:
         return False, "Permission denied. Run app as Administrator for auto-cookies."
@@ -93,13 +177,13 @@ def get_info():
         "skip_download": True,
         "noplaylist": True,
         "ignoreerrors": True,
-        "cookiefile": COOKIE_FILE if os.path.exists(COOKIE_FILE) else None,
+        "cookiefile": cookie_file_for_ydl(),
         "retries": 2,
         "socket_timeout": 10,
     }
 
     try:
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        with borrowed_ydl(ydl_opts) as ydl:
             info = ydl.extract_info(clean_url, download=False)
         if not info:
             return jsonify({"error": "No info found. Login or cookie required."}), 400